@@ -0,0 +1,143 @@
+"""Solves many independent problems on a process pool.
+
+One problem per hospital group and planning scenario used to mean one run of
+a script's main() each. solve_batch() takes a list of problems (any of the
+HospitalSchedulingProblem / SchoolSchedulingProblem classes, or BatchJobs
+wrapping them with per-job settings), solves them in worker processes and
+yields a BatchResult as each job completes, in completion order.
+
+Every job gets its own time limit, an 'enumerate' job that reaches it returns
+the count so far with complete=False. The CP-SAT workers per job are capped
+so that jobs running at once times workers per job stays within the machine's
+cores instead of every job starting its default 8 threads.
+
+  for result in solve_batch(problems, time_limit=60):
+    print(result.name, result.status, result.seconds)
+"""
+
+import concurrent.futures
+import contextlib
+import importlib
+import io
+import multiprocessing
+import os
+import time
+
+from solution_sinks import CountOnlySink
+
+
+class BatchJob(object):
+
+  def __init__(self, problem, name=None, mode='optimize', objective=None,
+               time_limit=None, random_seed=None, solver_options=None):
+    self.problem = problem
+    self.name = name
+    # 'optimize' returns one roster, 'enumerate' counts the solutions
+    self.mode = mode
+    self.objective = objective
+    self.time_limit = time_limit
+    self.random_seed = random_seed
+    # Extra keyword arguments for the solver constructor
+    self.solver_options = dict(solver_options or {})
+
+
+class BatchResult(object):
+
+  def __init__(self, index, name):
+    self.index = index
+    self.name = name
+    # CP-SAT status name, 'ERROR' when the job raised
+    self.status = None
+    # 0/1 assignment tensor ('optimize') or None
+    self.values = None
+    # Number of solutions ('enumerate'), only the ones found before the time
+    # limit when complete is False
+    self.count = None
+    self.complete = None
+    self.seconds = None
+    self.telemetry = None
+    self.output = ''
+    self.error = None
+
+  def __repr__(self):
+    return 'BatchResult(%r, %s, %.2fs)' % (self.name, self.status, self.seconds or 0)
+
+
+def solver_class(problem):
+  # SchoolSchedulingProblem -> SchoolSchedulingSatSolver of the same module
+  module = importlib.import_module(type(problem).__module__)
+  name = type(problem).__name__.replace('Problem', 'SatSolver')
+  return getattr(module, name)
+
+
+def workers_per_job(num_jobs, max_jobs=None, cpu_count=None):
+  """Returns (jobs running at once, CP-SAT workers per job)."""
+  cpu_count = cpu_count or os.cpu_count() or 1
+  running = max(1, min(num_jobs, max_jobs or cpu_count))
+  return running, max(1, cpu_count // running)
+
+
+def run_job(index, job, num_search_workers):
+  # Runs in a worker process
+  result = BatchResult(index, job.name)
+  start = time.perf_counter()
+  output = io.StringIO()
+  with contextlib.redirect_stdout(output):
+    options = dict({'sparse': True, 'var_names': False}, **job.solver_options)
+    solver = solver_class(job.problem)(job.problem, **options)
+    if job.mode == 'optimize':
+      result.values = solver.solve(mode='optimize', objective=job.objective,
+                                   num_search_workers=num_search_workers,
+                                   time_limit=job.time_limit,
+                                   random_seed=job.random_seed)
+    else:
+      result.count = solver.solve(mode='enumerate', time_limit=job.time_limit,
+                                  sink=CountOnlySink())
+      result.complete = solver.complete
+  result.status = solver.telemetry.search.get('status')
+  result.telemetry = solver.telemetry.report()
+  result.output = output.getvalue()
+  result.seconds = time.perf_counter() - start
+  return result
+
+
+def solve_batch(jobs, max_jobs=None, num_search_workers=None, time_limit=None,
+                objective=None, mode='optimize'):
+  """Yields a BatchResult per job as the jobs complete.
+
+  `jobs` holds problems or BatchJobs; bare problems get `mode`, `objective`
+  and `time_limit`. At most `max_jobs` run at once (default: one per core)
+  with `num_search_workers` CP-SAT workers each (default: the cores split
+  between the running jobs). A job that raises yields a result with status
+  'ERROR' and the exception in `error`, the other jobs go on.
+  """
+  jobs = [job if isinstance(job, BatchJob) else
+          BatchJob(job, mode=mode, objective=objective, time_limit=time_limit)
+          for job in jobs]
+  for index, job in enumerate(jobs):
+    if job.name is None:
+      job.name = 'job %i' % index
+  running, workers = workers_per_job(len(jobs), max_jobs)
+  if num_search_workers is not None:
+    workers = num_search_workers
+
+  # spawn: fresh interpreters, forking a process that already runs solver
+  # threads is not safe
+  context = multiprocessing.get_context('spawn')
+  with concurrent.futures.ProcessPoolExecutor(running, mp_context=context) as pool:
+    futures = dict((pool.submit(run_job, index, job, workers), index)
+                   for index, job in enumerate(jobs))
+    try:
+      for future in concurrent.futures.as_completed(futures):
+        try:
+          result = future.result()
+        except Exception as e:  # reported in the result
+          index = futures[future]
+          result = BatchResult(index, jobs[index].name)
+          result.status = 'ERROR'
+          result.error = e
+        yield result
+    finally:
+      # The caller stopped early, drop the jobs that haven't started
+      for future in futures:
+        future.cancel()
@@ -0,0 +1,357 @@
+"""Synthetic instances and a scaling benchmark for the solvers.
+
+The hard-coded instances in each main() are far too small to tell how build
+and solve time scale. hospital_instance() and school_instance() generate
+random problems from a few knobs (people, areas or subjects, specialty
+density, weeks, schedules/versions, capacity slack), and the suites below
+sweep them. For every case the benchmark records:
+
+  build_seconds           solver constructor, i.e. the CpModel build
+  variables, constraints  size of the model proto
+  peak_rss_mb             peak resident memory of the case's process
+  build_rss_mb            the part of it above the interpreter + imports
+  first_solution_seconds  enumeration time to the first solution
+  solutions_per_second    enumeration rate over the sampling window
+
+Each case runs in a fresh process so the memory peak is its own. Results are
+written as JSON and compared against a stored baseline; the exit status is 1
+when a metric regressed by more than the threshold. The smoke suite's results
+are committed in benchmark_baseline.json, the default baseline; rewrite it
+with --out when a change is meant to move the numbers or on a new machine,
+the timings depend on it.
+
+  python benchmark.py
+  python benchmark.py --out benchmark_baseline.json
+  python benchmark.py --suite scaling --out results.json
+  python benchmark.py --suite scaling --baseline results.json --threshold 0.25
+"""
+
+import argparse
+import concurrent.futures
+import importlib
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+import time
+
+import ortools
+from ortools.sat.python import cp_model
+
+from batch import solver_class
+
+
+# Smoke suite results to compare against by default
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'benchmark_baseline.json')
+
+# Solver module -> problem family
+SOLVERS = {
+    'marko_weeks': 'hospital',
+    'marko': 'school',
+    'school_all': 'school',
+    'school_2': 'school',
+}
+
+# Per metric: True when lower is better, and the absolute change below which
+# a difference is noise
+METRICS = {
+    'build_seconds': (True, 0.05),
+    'variables': (True, 0),
+    'constraints': (True, 0),
+    'peak_rss_mb': (True, 5.0),
+    'first_solution_seconds': (True, 0.05),
+    'solutions_per_second': (False, 10.0),
+}
+
+
+def hospital_instance(num_doctors=17, num_areas=11, density=0.2, num_weeks=1,
+                      num_schedules=1, num_versions=1, num_days=5, slack=1.5,
+                      seed=0):
+  """Random HospitalSchedulingProblem.
+
+  Every area gets round(density * num_doctors) specialists (at least one).
+  The curriculum splits each area's days over the schedules, so that across
+  all versions every area is covered exactly once a day. Doctor work days
+  are set so the total capacity is `slack` times the weekly demand.
+  """
+  from marko_weeks import HospitalSchedulingProblem
+  if num_days % num_versions:
+    raise ValueError('num_days (%i) must be a multiple of num_versions (%i)' % (
+        num_days, num_versions))
+  rng = random.Random(seed)
+  areas = ['Area %i' % a for a in range(num_areas)]
+  doctors = ['Doctor %i' % d for d in range(num_doctors)]
+  schedules = ['S%i' % s for s in range(num_schedules)]
+  versions = ['V%i' % v for v in range(num_versions)]
+  weeks = ['Week %i' % w for w in range(num_weeks)]
+  working_days = ['Day %i' % day for day in range(num_days)]
+
+  per_area = max(1, int(round(density * num_doctors)))
+  specialties = [sorted(rng.sample(range(num_doctors), per_area))
+                 for a in range(num_areas)]
+
+  curriculum = {}
+  for area in areas:
+    split = [0] * num_schedules
+    for _ in range(num_days // num_versions):
+      split[rng.randrange(num_schedules)] += 1
+    for schedule, days in zip(schedules, split):
+      curriculum[schedule, area] = days
+
+  work_days = min(num_days, int(math.ceil(slack * num_areas * num_days / num_doctors)))
+  return HospitalSchedulingProblem(areas, doctors, curriculum, specialties, weeks,
+                                   working_days, schedules, versions,
+                                   [work_days] * num_doctors)
+
+
+def school_instance(module='school_all', num_teachers=4, num_subjects=3,
+                    density=0.5, num_levels=3, num_sections=1, num_days=5,
+                    num_periods=3, slack=1.5, seed=0):
+  """Random SchoolSchedulingProblem of the given solver module.
+
+  Each subject gets round(density * num_teachers) teachers (at least one),
+  each level a random number of hours per subject, and teacher hours are set
+  so the total capacity is `slack` times the demand. marko.py has no periods
+  and school_2.py no levels or sections, those knobs are ignored there.
+  """
+  problem_class = importlib.import_module(module).SchoolSchedulingProblem
+  rng = random.Random(seed)
+  subjects = ['Subject %i' % s for s in range(num_subjects)]
+  teachers = ['Teacher %i' % t for t in range(num_teachers)]
+  levels = ['%i-' % (l + 1) for l in range(num_levels)]
+  sections = [chr(ord('A') + s) for s in range(num_sections)]
+  working_days = ['Day %i' % day for day in range(num_days)]
+  periods = ['Period %i' % p for p in range(num_periods)]
+  num_slots = num_days * (1 if module == 'marko' else num_periods)
+
+  per_subject = max(1, int(round(density * num_teachers)))
+  specialties = [sorted(rng.sample(range(num_teachers), per_subject))
+                 for s in range(num_subjects)]
+
+  most = max(1, num_slots // num_subjects)
+  curriculum = {}
+  for level in levels:
+    for subject in subjects:
+      curriculum[level, subject] = rng.randint(1, most)
+  demand = sum(curriculum.values()) * num_sections
+  hours = min(num_slots, int(math.ceil(slack * demand / num_teachers)))
+  work_hours = [hours] * num_teachers
+
+  if module == 'marko':
+    return problem_class(subjects, teachers, curriculum, specialties,
+                         working_days, levels, sections, work_hours)
+  if module == 'school_2':
+    return problem_class(subjects, teachers, curriculum, specialties,
+                         working_days, periods, work_hours)
+  return problem_class(subjects, teachers, curriculum, specialties,
+                       working_days, periods, levels, sections, work_hours)
+
+
+def instance(solver, **params):
+  if SOLVERS[solver] == 'hospital':
+    return hospital_instance(**params)
+  return school_instance(solver, **params)
+
+
+def case(solver, options=None, **params):
+  # One benchmark case: solver module, generator params, solver options
+  return {'solver': solver, 'params': params,
+          'options': dict({'sparse': True, 'var_names': False}, **(options or {}))}
+
+
+SUITES = {
+    'smoke': [
+        case('marko_weeks'),
+        case('marko', num_levels=1),
+        case('school_all'),
+        case('school_2'),
+    ],
+    'scaling': [
+        case('marko_weeks', num_doctors=n, num_areas=n // 2, num_weeks=w)
+        for n in (20, 40, 80) for w in (1, 4, 12)
+    ] + [
+        case('marko_weeks', num_doctors=40, num_areas=20, density=d, num_weeks=4)
+        for d in (0.1, 0.3, 0.6)
+    ] + [
+        case('marko_weeks', num_doctors=40, num_areas=20, num_weeks=4,
+             num_schedules=s, num_versions=v)
+        for s, v in ((2, 1), (1, 5), (3, 5))
+    ] + [
+        case('marko_weeks', num_doctors=40, num_areas=20, num_weeks=4, slack=s)
+        for s in (1.1, 2.0)
+    ] + [
+        case(solver, num_teachers=t, num_subjects=t // 2, num_levels=l)
+        for solver in ('marko', 'school_all', 'school_2')
+        for t, l in ((8, 3), (16, 6), (32, 12))
+    ],
+    # school_all: "same teacher for a course's subject", see
+    # SchoolSchedulingSatSolver.add_teacher_per_course()
+    'teacher_encoding': [
+        case('school_all', {'teacher_encoding': encoding, 'sparse': sparse},
+             num_teachers=t, num_subjects=t // 2, num_levels=l, density=0.3,
+             slack=2.0)
+        for t, l in ((8, 3), (16, 6), (32, 12))
+        for sparse in (False, True)
+        for encoding in ('max_equality', 'selection')
+    ],
+}
+
+
+def case_key(c):
+  return '%s %s %s' % (c['solver'], json.dumps(c['params'], sort_keys=True),
+                       json.dumps(c['options'], sort_keys=True))
+
+
+class TimingCallback(cp_model.CpSolverSolutionCallback):
+
+  def __init__(self, max_solutions):
+    cp_model.CpSolverSolutionCallback.__init__(self)
+    self.max_solutions = max_solutions
+    self.first = None
+    self.count = 0
+
+  def on_solution_callback(self):
+    self.count += 1
+    if self.first is None:
+      self.first = time.perf_counter()
+    if self.count >= self.max_solutions:
+      self.StopSearch()
+
+
+def max_rss_mb():
+  # ru_maxrss is in KiB on Linux and bytes on macOS
+  rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  return rss / (1 << 20) if sys.platform == 'darwin' else rss / (1 << 10)
+
+
+def run_case(c, enumerate_seconds, max_solutions):
+  # Runs in its own process, see run()
+  problem = instance(c['solver'], **c['params'])
+  base_rss = max_rss_mb()
+
+  start = time.perf_counter()
+  solver = solver_class(problem)(problem, **c['options'])
+  build_seconds = time.perf_counter() - start
+  peak_rss = max_rss_mb()
+  proto = solver.model.Proto()
+
+  sat = cp_model.CpSolver()
+  sat.parameters.enumerate_all_solutions = True
+  sat.parameters.max_time_in_seconds = enumerate_seconds
+  callback = TimingCallback(max_solutions)
+  start = time.perf_counter()
+  status = sat.Solve(solver.model, callback)
+  elapsed = time.perf_counter() - start
+
+  result = dict(c)
+  result.update({
+      'build_seconds': build_seconds,
+      'variables': len(proto.variables),
+      'constraints': len(proto.constraints),
+      'peak_rss_mb': max(peak_rss, max_rss_mb()),
+      'build_rss_mb': peak_rss - base_rss,
+      'status': sat.StatusName(status),
+      'solutions': callback.count,
+      'first_solution_seconds': (callback.first - start
+                                 if callback.first is not None else None),
+      'solutions_per_second': callback.count / elapsed if elapsed else None,
+  })
+  return result
+
+
+def run(cases, enumerate_seconds=2.0, max_solutions=100000, log=None):
+  results = []
+  context = multiprocessing.get_context('spawn')
+  for c in cases:
+    # A fresh interpreter per case, so ru_maxrss is the case's own peak
+    with concurrent.futures.ProcessPoolExecutor(1, mp_context=context) as pool:
+      result = pool.submit(run_case, c, enumerate_seconds, max_solutions).result()
+    results.append(result)
+    if log is not None:
+      log('%-60s build %7.3fs %8i vars %6.0f MB  %s sol/s' % (
+          case_key(c)[:60], result['build_seconds'], result['variables'],
+          result['peak_rss_mb'], format_rate(result['solutions_per_second'])))
+  return {
+      'meta': {
+          'python': platform.python_version(),
+          'ortools': ortools.__version__,
+          'platform': platform.platform(),
+          'enumerate_seconds': enumerate_seconds,
+          'max_solutions': max_solutions,
+      },
+      'results': results,
+  }
+
+
+def format_rate(rate):
+  return '-' if rate is None else '%.0f' % rate
+
+
+def compare(report, baseline, threshold=0.2):
+  """Returns [(case key, metric, baseline value, new value)] regressions.
+
+  A metric regresses when it got worse by more than `threshold` (relative)
+  and by more than its noise floor in METRICS (absolute). Cases missing from
+  the baseline are skipped.
+  """
+  previous = dict((case_key(r), r) for r in baseline['results'])
+  regressions = []
+  for result in report['results']:
+    key = case_key(result)
+    if key not in previous:
+      continue
+    for metric, (lower_is_better, noise) in METRICS.items():
+      old, new = previous[key].get(metric), result.get(metric)
+      if old is None or new is None:
+        continue
+      worse = new - old if lower_is_better else old - new
+      if worse > noise and worse > threshold * abs(old):
+        regressions.append((key, metric, old, new))
+  return regressions
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+  parser.add_argument('--suite', choices=sorted(SUITES), default='smoke')
+  parser.add_argument('--solvers', help='comma separated solver modules to keep')
+  parser.add_argument('--out', help='write the results JSON here')
+  parser.add_argument('--baseline', default=BASELINE,
+                      help='results JSON to compare against, \'\' to skip '
+                           '(default: %(default)s)')
+  parser.add_argument('--threshold', type=float, default=0.2,
+                      help='relative change that counts as a regression')
+  parser.add_argument('--enumerate-seconds', type=float, default=2.0)
+  parser.add_argument('--max-solutions', type=int, default=100000)
+  args = parser.parse_args()
+
+  cases = SUITES[args.suite]
+  if args.solvers:
+    keep = args.solvers.split(',')
+    cases = [c for c in cases if c['solver'] in keep]
+  report = run(cases, args.enumerate_seconds, args.max_solutions, log=print)
+  if args.out:
+    with open(args.out, 'w') as f:
+      json.dump(report, f, indent=2, sort_keys=True)
+
+  if args.baseline:
+    with open(args.baseline) as f:
+      baseline = json.load(f)
+    known = set(case_key(r) for r in baseline['results'])
+    if not any(case_key(r) in known for r in report['results']):
+      print('No case of this run is in %s' % args.baseline)
+      return
+    regressions = compare(report, baseline, args.threshold)
+    for key, metric, old, new in regressions:
+      print('REGRESSION %s %s: %.4g -> %.4g' % (key, metric, old, new))
+    if regressions:
+      sys.exit(1)
+    print('No regressions against %s' % args.baseline)
+
+
+if __name__ == '__main__':
+  main()
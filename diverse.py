@@ -0,0 +1,112 @@
+"""K alternative rosters that actually differ.
+
+The solutions a_few_solutions prints come out of one enumeration, one after
+the other, and differ in a handful of cells. diverse_solutions() gets K
+alternatives in two steps:
+
+  1. K independent solves run in parallel processes (batch.py), each
+     minimizing a random linear objective over the assignment cells with its
+     own seed, which sends each one to a different corner of the solution
+     space. The rosters closer than min_distance to one kept before are
+     dropped.
+  2. While fewer than K are kept, one model is solved again and again, each
+     time with a constraint to differ from every roster kept so far in at
+     least min_distance cells. It stops early when no further roster is that
+     far from the others.
+
+The distance is the Hamming distance between the 0/1 assignment tensors;
+moving one assignment elsewhere changes two cells.
+
+  rosters = diverse_solutions(problem, 5, time_limit=10)
+
+Works with every solver batch.py knows (marko_weeks, marko, school_all,
+school_2).
+"""
+
+import contextlib
+import io
+
+import numpy as np
+from ortools.sat.python import cp_model
+
+from batch import BatchJob
+from batch import solve_batch
+from batch import solver_class
+
+
+class RandomObjective(object):
+  # Random weights on the assignment cells, picklable for the worker
+  # processes unlike a lambda
+
+  def __init__(self, seed, high=100):
+    self.seed = seed
+    self.high = high
+
+  def __call__(self, solver):
+    tensor = solver.assignment
+    weights = np.random.default_rng(self.seed).integers(0, self.high, tensor.shape)
+    return cp_model.LinearExpr.WeightedSum(list(tensor.vars[tensor.mask]),
+                                           weights[tensor.mask].tolist())
+
+
+def distance(a, b):
+  return int(np.count_nonzero(a != b))
+
+
+def diverse_solutions(problem, k, min_distance=None, time_limit=10.0,
+                      max_jobs=None, num_search_workers=None, seed=0,
+                      solver_options=None):
+  """Returns up to k rosters pairwise at least min_distance cells apart.
+
+  min_distance defaults to a fifth of the cells set in the first roster
+  found. `time_limit` applies to each solve of both steps. Fewer than k
+  rosters come back when no more exist at that distance, or the solves run
+  out of time. `num_search_workers` are the CP-SAT workers of each solve, by
+  default the cores split between the parallel solves of step 1 (see
+  solve_batch) and 8 for the solves of step 2.
+  """
+  options = dict({'sparse': True, 'var_names': False}, **(solver_options or {}))
+
+  # 1. Parallel randomized solves
+  jobs = [BatchJob(problem, name='seed %i' % i, objective=RandomObjective(seed + i),
+                   time_limit=time_limit, random_seed=seed + i,
+                   solver_options=options)
+          for i in range(k)]
+  found = []
+  for result in solve_batch(jobs, max_jobs=max_jobs,
+                            num_search_workers=num_search_workers):
+    if result.values is not None:
+      found.append((result.index, result.values))
+  found = [values for _, values in sorted(found, key=lambda x: x[0])]
+  if found and min_distance is None:
+    min_distance = max(1, int(found[0].sum()) // 5)
+  kept = []
+  for values in found:
+    if all(distance(values, other) >= min_distance for other in kept):
+      kept.append(values)
+
+  # 2. Sequential solves away from the rosters kept so far
+  if len(kept) < k:
+    with contextlib.redirect_stdout(io.StringIO()):
+      solver = solver_class(problem)(problem, **options)
+      for values in kept:
+        solver.model.Add(solver.hamming_distance(values) >= min_distance)
+      while len(kept) < k:
+        values = solver.solve(mode='optimize', num_search_workers=num_search_workers or 8,
+                              time_limit=time_limit, random_seed=seed + len(kept))
+        if values is None:
+          break
+        kept.append(values)
+        if min_distance is None:
+          min_distance = max(1, int(values.sum()) // 5)
+        solver.model.Add(solver.hamming_distance(values) >= min_distance)
+  return kept
+
+
+def pairwise_distances(rosters):
+  """Matrix of the Hamming distances between the rosters."""
+  result = np.zeros((len(rosters), len(rosters)), dtype=np.int64)
+  for i, a in enumerate(rosters):
+    for j in range(i + 1, len(rosters)):
+      result[i, j] = result[j, i] = distance(a, rosters[j])
+  return result
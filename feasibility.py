@@ -0,0 +1,200 @@
+"""Max-flow feasibility pre-check, run before any CP-SAT model is built.
+
+Some curriculum/specialty combinations can't be satisfied, e.g. one doctor
+being the only specialist of two areas that both need every day. CP-SAT only
+tells after the model is built and the search runs out. check_feasibility()
+answers in milliseconds with a bipartite flow: area-day demand on one side,
+doctor-day capacity on the other, capped by each doctor's work days. If the
+maximum flow can't cover the demand the problem is infeasible, and the source
+side of the minimum cut names the areas that can't be staffed and the doctors
+that are the bottleneck.
+
+For HospitalSchedulingProblem (marko_weeks.py) the network is built per week:
+
+  source -> (area, day) -> (doctor, day) -> doctor -> sink
+             cap 1          cap 1            cap doctor_work_days
+
+With one schedule version a full flow is also sufficient. For the school
+problems of marko.py / school_all.py courses take the place of areas:
+
+  source -> (course, subject) -> teacher -> sink
+             cap curriculum                 cap min(work hours, slots)
+
+which is exact for marko.py and a necessary condition for school_all.py. In
+both cases deficient_areas holds the demand side (areas, or course subjects)
+and limiting_doctors the capacity side (doctors, or teachers).
+"""
+
+import numpy as np
+
+from ortools.graph.python import max_flow
+
+
+SOURCE = 0
+SINK = 1
+
+
+class FeasibilityReport(object):
+
+  def __init__(self):
+    self.feasible = True
+    self.demand = 0
+    self.flow = 0
+    # Problems found before any flow, e.g. curriculum totals vs coverage
+    self.messages = []
+    # name -> list of days that can't be covered (or the slots required)
+    self.deficient_areas = {}
+    # name -> reason, e.g. 'all 4 work days used' or 'busy on Monday'
+    self.limiting_doctors = {}
+
+  def __bool__(self):
+    return self.feasible
+
+  def __str__(self):
+    if self.feasible:
+      return 'Feasibility check passed (%i of %i covered)' % (self.flow, self.demand)
+    lines = ['Infeasible: %i of %i demand can be covered' % (self.flow, self.demand)]
+    for message in self.messages:
+      lines.append('  - %s' % message)
+    for name, days in self.deficient_areas.items():
+      lines.append('  - %s can\'t be fully covered (%s)' % (name, ', '.join(days)))
+    for name, reason in self.limiting_doctors.items():
+      lines.append('  - %s is a bottleneck: %s' % (name, reason))
+    return '\n'.join(lines)
+
+
+class FlowNetwork(object):
+
+  def __init__(self):
+    self.tails = []
+    self.heads = []
+    self.capacities = []
+    self.num_nodes = 2
+
+  def add_nodes(self, count):
+    first = self.num_nodes
+    self.num_nodes += count
+    return first
+
+  def add_arc(self, tail, head, capacity):
+    self.tails.append(tail)
+    self.heads.append(head)
+    self.capacities.append(capacity)
+
+  def solve(self):
+    # Returns (max flow, set of nodes on the source side of the min cut)
+    flow = max_flow.SimpleMaxFlow()
+    flow.add_arcs_with_capacity(np.array(self.tails, dtype=np.int32),
+                                np.array(self.heads, dtype=np.int32),
+                                np.array(self.capacities, dtype=np.int64))
+    if flow.solve(SOURCE, SINK) != flow.OPTIMAL:
+      raise RuntimeError('max flow failed')
+    return flow.optimal_flow(), set(flow.get_source_side_min_cut())
+
+
+def check_feasibility(problem):
+  if hasattr(problem, 'weeks'):
+    return check_hospital(problem)
+  return check_school(problem)
+
+
+def check_hospital(problem):
+  report = FeasibilityReport()
+  num_days = len(problem.working_days)
+  num_areas = len(problem.areas)
+  num_doctors = len(problem.doctors)
+  num_versions = len(problem.versions)
+
+  # Every area is covered exactly once a day across the schedule versions, so
+  # the curriculum of all versions has to add up to the number of days
+  for area in problem.areas:
+    total = sum(problem.curriculum[schedule, area]
+                for schedule in problem.schedules) * num_versions
+    if total != num_days:
+      report.feasible = False
+      report.messages.append(
+          'area %s: curriculum asks for %i days over all schedule versions, '
+          'coverage needs exactly %i' % (area, total, num_days))
+
+  for w, week in enumerate(problem.weeks):
+    network = FlowNetwork()
+    area_day = network.add_nodes(num_areas * num_days)
+    doctor_day = network.add_nodes(num_doctors * num_days)
+    doctor = network.add_nodes(num_doctors)
+    for a in range(num_areas):
+      for day in range(num_days):
+        network.add_arc(SOURCE, area_day + a * num_days + day, 1)
+        for d in set(problem.specialties[a]):
+          if (d, w, day) not in problem.doctor_unavailable:
+            network.add_arc(area_day + a * num_days + day,
+                            doctor_day + d * num_days + day, 1)
+    for d in range(num_doctors):
+      for day in range(num_days):
+        network.add_arc(doctor_day + d * num_days + day, doctor + d, 1)
+      network.add_arc(doctor + d, SINK, min(problem.doctor_work_days[d], num_days))
+
+    flow, cut = network.solve()
+    report.demand += num_areas * num_days
+    report.flow += flow
+    if flow == num_areas * num_days:
+      continue
+
+    report.feasible = False
+    for a in range(num_areas):
+      days = [problem.working_days[day] for day in range(num_days)
+              if area_day + a * num_days + day in cut]
+      if days:
+        name = '%s (%s)' % (problem.areas[a], week)
+        report.deficient_areas[name] = days
+    for d in range(num_doctors):
+      name = '%s (%s)' % (problem.doctors[d], week)
+      if doctor + d in cut:
+        report.limiting_doctors[name] = 'all %i work days used' % problem.doctor_work_days[d]
+        continue
+      busy = [problem.working_days[day] for day in range(num_days)
+              if doctor_day + d * num_days + day in cut]
+      if busy:
+        report.limiting_doctors[name] = 'busy on %s' % ', '.join(busy)
+  return report
+
+
+def check_school(problem):
+  report = FeasibilityReport()
+  num_subjects = len(problem.subjects)
+  num_teachers = len(problem.teachers)
+  num_slots = len(problem.working_days) * len(getattr(problem, 'periods', [None]))
+  courses = [(level, section) for level in problem.levels
+             for section in problem.sections]
+
+  network = FlowNetwork()
+  course_subject = network.add_nodes(len(courses) * num_subjects)
+  teacher = network.add_nodes(num_teachers)
+  for c in range(len(courses)):
+    for s in range(num_subjects):
+      required = problem.curriculum[courses[c][0], problem.subjects[s]]
+      report.demand += required
+      network.add_arc(SOURCE, course_subject + c * num_subjects + s, required)
+      # A teacher gives at most one class per slot
+      for t in set(problem.specialties[s]):
+        network.add_arc(course_subject + c * num_subjects + s, teacher + t,
+                        min(required, num_slots))
+  for t in range(num_teachers):
+    network.add_arc(teacher + t, SINK, min(problem.teacher_work_hours[t], num_slots))
+
+  flow, cut = network.solve()
+  report.flow = flow
+  if flow == report.demand:
+    return report
+
+  report.feasible = False
+  for c in range(len(courses)):
+    for s in range(num_subjects):
+      if course_subject + c * num_subjects + s in cut:
+        name = '%s%s %s' % (courses[c][0], courses[c][1], problem.subjects[s])
+        report.deficient_areas[name] = ['%i slots' % problem.curriculum[
+            courses[c][0], problem.subjects[s]]]
+  for t in range(num_teachers):
+    if teacher + t in cut:
+      report.limiting_doctors[problem.teachers[t]] = 'all %i work hours used' % (
+          problem.teacher_work_hours[t])
+  return report
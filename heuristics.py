@@ -0,0 +1,115 @@
+"""Constructive roster for HospitalSchedulingProblem, without CP-SAT.
+
+construct_roster() fills each week with one min-cost flow, the bipartite
+matching of the (area, day) slots to the available (doctor, day) pairs of
+feasibility.py:
+
+  source -> (area, day) -> (doctor, day) -> doctor -> sink
+             cap 1          cap 1            doctor_work_days arcs of cap 1
+
+Matching the whole week at once, rather than day by day, never strands an
+area whose only doctors were used up earlier in the week. The k-th day of a
+doctor costs the days the doctor already worked (history and earlier weeks)
+plus k, so the work is spread as evenly as the specialties allow, which is
+also what the balance_workdays objective asks for. The days each area got are
+then dealt to the schedule versions in curriculum order.
+
+The result is shaped like HospitalSchedulingSatSolver(problem).assignment. It
+takes a fraction of a second, so it seeds the search as solution hints
+(solve(mode='optimize', warm_start=True)) and stands in as the answer when
+the search is disabled (mode='heuristic') or times out without a roster.
+"""
+
+import numpy as np
+from ortools.graph.python import min_cost_flow
+
+
+SOURCE = 0
+SINK = 1
+
+
+def construct_roster(problem, history=None):
+  """Returns a 0/1 roster or None when some week can't be covered."""
+  num_areas = len(problem.areas)
+  num_doctors = len(problem.doctors)
+  num_days = len(problem.working_days)
+  num_versions = len(problem.versions)
+  num_weeks = len(problem.weeks)
+  num_schedule_versions = len(problem.schedules) * num_versions
+
+  # Days of each area per schedule version, the same every week
+  required = np.zeros((num_schedule_versions, num_areas), dtype=np.int64)
+  for sch, schedule in enumerate(problem.schedules):
+    for a, area in enumerate(problem.areas):
+      required[sch * num_versions:(sch + 1) * num_versions, a] = (
+          problem.curriculum[schedule, area])
+  if (required.sum(axis=0) != num_days).any():
+    return None
+
+  values = np.zeros((num_schedule_versions, num_weeks, num_areas, num_doctors,
+                     num_days), dtype=np.int8)
+  worked = np.zeros(num_doctors, dtype=np.int64)
+  if history is not None:
+    worked += np.asarray(history.doctor_load, dtype=np.int64)
+  for w in range(num_weeks):
+    week = cover_week(problem, w, worked)
+    if week is None:
+      return None
+    worked += week.any(axis=0).sum(axis=1)
+    # Days of each area to its schedule versions, in order
+    for a in range(num_areas):
+      days = np.nonzero(week[a].any(axis=0))[0]
+      doctors = week[a].argmax(axis=0)
+      sv = np.repeat(np.arange(num_schedule_versions), required[:, a])
+      values[sv, w, a, doctors[days], days] = 1
+  return values
+
+
+def cover_week(problem, w, worked):
+  # (area, doctor, day) 0/1 for one week, None when the flow can't cover it
+  num_areas = len(problem.areas)
+  num_doctors = len(problem.doctors)
+  num_days = len(problem.working_days)
+  area_day = 2
+  doctor_day = area_day + num_areas * num_days
+  doctor = doctor_day + num_doctors * num_days
+
+  tails, heads, capacities, costs = [], [], [], []
+
+  def arc(tail, head, cost=0):
+    tails.append(tail)
+    heads.append(head)
+    capacities.append(1)
+    costs.append(cost)
+
+  cells = []
+  for a in range(num_areas):
+    for day in range(num_days):
+      arc(SOURCE, area_day + a * num_days + day)
+      for d in sorted(set(problem.specialties[a])):
+        if (d, w, day) not in problem.doctor_unavailable:
+          cells.append((len(tails), a, d, day))
+          arc(area_day + a * num_days + day, doctor_day + d * num_days + day)
+  for d in range(num_doctors):
+    for day in range(num_days):
+      arc(doctor_day + d * num_days + day, doctor + d)
+    for k in range(min(problem.doctor_work_days[d], num_days)):
+      arc(doctor + d, SINK, int(worked[d]) + k)
+
+  flow = min_cost_flow.SimpleMinCostFlow()
+  flow.add_arcs_with_capacity_and_unit_cost(
+      np.array(tails, dtype=np.int32), np.array(heads, dtype=np.int32),
+      np.array(capacities, dtype=np.int64), np.array(costs, dtype=np.int64))
+  # The supplies bound the flow, a short flow means the week can't be covered
+  flow.set_node_supply(SOURCE, num_areas * num_days)
+  flow.set_node_supply(SINK, -num_areas * num_days)
+  if flow.solve_max_flow_with_min_cost() != flow.OPTIMAL:
+    return None
+  if flow.maximum_flow() < num_areas * num_days:
+    return None
+
+  week = np.zeros((num_areas, num_doctors, num_days), dtype=np.int8)
+  for index, a, d, day in cells:
+    if flow.flow(index):
+      week[a, d, day] = 1
+  return week
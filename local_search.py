@@ -0,0 +1,253 @@
+"""Simulated annealing for HospitalSchedulingProblem, for rosters too large
+for the CP-SAT model.
+
+The roster is an integer array of shape (weeks, days, areas) holding the
+doctor of each cell, -1 when it's uncovered. Cells only ever get a doctor
+eligible for the area and available that day, so the hard rules left to
+repair are
+
+  - coverage: cells still at -1
+  - double booking: a doctor in two areas on the same day
+  - over capacity: more than doctor_work_days cells in a week
+
+and under them, the spread of the days worked over the horizon (sum of the
+squared totals, history included), the balance_workdays objective made
+smooth. One violation outweighs any change of the spread.
+
+Each iteration proposes a batch of reassignments at once: random cells (half
+of them among the violating cells) each get a random candidate doctor. The
+cost deltas of the whole batch are computed with NumPy from per
+(week, day, doctor) and (week, doctor) counters, the moves are accepted with
+the Metropolis rule and the accepted moves that share a doctor or a cell with
+an earlier one are dropped, so the deltas stay exact and the counters are
+updated in place.
+
+  search = LocalSearchSolver(problem, seed=1)
+  roster = search.solve(time_limit=300)
+  print(search.violations())
+
+The schedule versions don't interact with the doctors, versions_of() deals
+each area's days to them in curriculum order; values() expands both into the
+assignment tensor layout of HospitalSchedulingSatSolver for small rosters.
+"""
+
+import time
+
+import numpy as np
+
+from telemetry import Telemetry
+
+
+class LocalSearchSolver(object):
+
+  def __init__(self, problem, history=None, seed=0, batch_size=256,
+               temperature=(2.0, 0.05), telemetry=None):
+    self.problem = problem
+    self.num_weeks = len(problem.weeks)
+    self.num_days = len(problem.working_days)
+    self.num_areas = len(problem.areas)
+    self.num_doctors = len(problem.doctors)
+    self.shape = (self.num_weeks, self.num_days, self.num_areas)
+    self.random = np.random.default_rng(seed)
+    self.batch_size = batch_size
+    # Start and end temperature of the geometric cooling
+    self.temperature = temperature
+    self.telemetry = Telemetry() if telemetry is None else telemetry
+
+    # Area -> eligible doctors, padded with -1
+    eligible = [sorted(set(problem.specialties[a])) for a in range(self.num_areas)]
+    self.num_eligible = np.array([len(e) for e in eligible], dtype=np.int64)
+    self.eligible = np.full((self.num_areas, max(1, self.num_eligible.max())), -1,
+                            dtype=np.int64)
+    for a, doctors in enumerate(eligible):
+      self.eligible[a, :len(doctors)] = doctors
+    # (doctor, week, day) the doctor can't work, one extra row for -1
+    self.unavailable = np.zeros((self.num_doctors + 1, self.num_weeks, self.num_days),
+                                dtype=bool)
+    if problem.doctor_unavailable:
+      self.unavailable[tuple(np.array(sorted(problem.doctor_unavailable)).T)] = True
+    self.work_days = np.append(np.array(problem.doctor_work_days, dtype=np.int64), 0)
+    self.prior = np.zeros(self.num_doctors + 1, dtype=np.int64)
+    if history is not None:
+      self.prior[:-1] = history.doctor_load
+    # A violation costs more than the spread can ever change in one move
+    self.weight = 2 * (self.num_weeks * self.num_days + int(self.prior.max())) + 2
+
+    self.roster = None
+    self.iterations = 0
+    self.accepted = 0
+
+  def initial_roster(self):
+    # Every cell gets a random eligible doctor, retried a few times when the
+    # pick is unavailable, -1 when none turned up
+    roster = np.full(self.shape, -1, dtype=np.int64)
+    weeks, days, areas = np.indices(self.shape).reshape(3, -1)
+    open_cells = np.arange(roster.size)
+    for _ in range(8):
+      doctors = self.candidates(areas[open_cells])
+      ok = (doctors >= 0) & ~self.unavailable[doctors, weeks[open_cells], days[open_cells]]
+      roster.flat[open_cells[ok]] = doctors[ok]
+      open_cells = open_cells[~ok]
+    return roster
+
+  def candidates(self, areas):
+    # One random eligible doctor per area, -1 for areas without any
+    picks = (self.random.random(len(areas)) * self.num_eligible[areas]).astype(np.int64)
+    return self.eligible[areas, np.minimum(picks, self.eligible.shape[1] - 1)]
+
+  def counters(self, roster):
+    # Cells per (week, day, doctor) and (week, doctor), total days per
+    # doctor; index num_doctors (-1) collects the uncovered cells
+    weeks, days, _ = np.indices(self.shape)
+    daily = np.zeros((self.num_weeks, self.num_days, self.num_doctors + 1), dtype=np.int64)
+    np.add.at(daily, (weeks, days, roster), 1)
+    weekly = daily.sum(axis=1)
+    totals = self.prior + weekly.sum(axis=0)
+    return daily, weekly, totals
+
+  def violations(self, roster=None):
+    roster = self.roster if roster is None else roster
+    daily, weekly, _ = self.counters(roster)
+    return {
+        'uncovered': int(daily[..., -1].sum()),
+        'double booked': int(np.maximum(daily[..., :-1] - 1, 0).sum()),
+        'over capacity': int(np.maximum(weekly[:, :-1] - self.work_days[:-1], 0).sum()),
+    }
+
+  def cost(self, roster):
+    violations = sum(self.violations(roster).values())
+    totals = self.counters(roster)[2][:-1]
+    return self.weight * violations + int((totals ** 2).sum())
+
+  def violating_cells(self, roster, daily, weekly):
+    doctors = roster.reshape(-1)
+    weeks, days, _ = np.indices(self.shape).reshape(3, -1)
+    bad = ((doctors < 0) | (daily[weeks, days, doctors] > 1) |
+           (weekly[weeks, doctors] > self.work_days[doctors]))
+    return np.nonzero(bad)[0]
+
+  def solve(self, time_limit=60.0, max_iterations=None, start=None,
+            refresh=50):
+    """Returns the best (weeks, days, areas) roster found.
+
+    The search stops after `time_limit` seconds or `max_iterations`,
+    whichever comes first, None for no limit of that kind. `start` is an
+    initial roster, e.g. from a previous run. The violating cells the
+    proposals focus on are recomputed every `refresh` iterations.
+    """
+    if time_limit is None and max_iterations is None:
+      raise ValueError('local search needs a time_limit or max_iterations')
+    with self.telemetry.phase('construction'):
+      roster = self.initial_roster() if start is None else np.array(start, dtype=np.int64)
+      daily, weekly, totals = self.counters(roster)
+    weeks, days, areas = np.indices(self.shape).reshape(3, -1)
+    flat = roster.reshape(-1)
+    best, best_cost = roster.copy(), self.cost(roster)
+    current_cost = best_cost
+    hot, cold = self.temperature
+    bad = np.arange(flat.size)
+
+    start_time = time.perf_counter()
+    with self.telemetry.phase('local search'):
+      while max_iterations is None or self.iterations < max_iterations:
+        elapsed = time.perf_counter() - start_time
+        if time_limit is not None and elapsed >= time_limit:
+          break
+        if self.iterations % refresh == 0:
+          bad = self.violating_cells(roster, daily, weekly)
+          # Violations weigh more than the spread, a feasible roster always
+          # beats an infeasible one
+          if current_cost < best_cost:
+            best, best_cost = roster.copy(), current_cost
+        # Share of the budget used, the temperature goes from hot to cold
+        progress = 0.0
+        if time_limit:
+          progress = elapsed / time_limit
+        if max_iterations:
+          progress = max(progress, self.iterations / max_iterations)
+        temperature = hot * (cold / hot) ** progress
+        self.iterations += 1
+
+        # Proposals, half of them on violating cells
+        cells = self.random.integers(0, flat.size, self.batch_size)
+        if len(bad):
+          half = self.batch_size // 2
+          cells[:half] = bad[self.random.integers(0, len(bad), half)]
+        w, d, a = weeks[cells], days[cells], areas[cells]
+        old = flat[cells]
+        new = self.candidates(a)
+        ok = (new >= 0) & (new != old) & ~self.unavailable[new, w, d]
+        cells, w, d, old, new = cells[ok], w[ok], d[ok], old[ok], new[ok]
+
+        delta = self.weight * (
+            (daily[w, d, new] >= 1).astype(np.int64)
+            - ((old >= 0) & (daily[w, d, old] >= 2))
+            + (weekly[w, new] >= self.work_days[new])
+            - ((old >= 0) & (weekly[w, old] > self.work_days[old]))
+            - (old < 0))
+        delta += 2 * totals[new] + 1
+        delta += np.where(old >= 0, 1 - 2 * totals[old], 0)
+        accept = (delta <= 0) | (self.random.random(len(delta)) <
+                                 np.exp(-np.maximum(delta, 0) / temperature))
+        cells, w, d, old, new, delta = (
+            x[accept] for x in (cells, w, d, old, new, delta))
+
+        # Keep moves whose doctors and cell no earlier accepted move touches
+        moves = np.arange(len(new))
+        covered = old >= 0
+        first = np.full(self.num_doctors, len(new))
+        np.minimum.at(first, np.concatenate([old[covered], new]),
+                      np.concatenate([moves[covered], moves]))
+        keep = (first[new] == moves) & (~covered | (first[old] == moves))
+        _, unique_cells = np.unique(cells, return_index=True)
+        keep &= np.isin(moves, unique_cells)
+        cells, w, d, old, new, delta = (
+            x[keep] for x in (cells, w, d, old, new, delta))
+
+        flat[cells] = new
+        daily[w, d, old] -= 1
+        daily[w, d, new] += 1
+        weekly[w, old] -= 1
+        weekly[w, new] += 1
+        totals[old] -= 1
+        totals[new] += 1
+        current_cost += int(delta.sum())
+        self.accepted += len(new)
+
+    if current_cost < best_cost:
+      best = roster.copy()
+    self.roster = best
+    return best
+
+  def versions_of(self, roster=None):
+    return versions_of(self.problem, self.roster if roster is None else roster)
+
+  def values(self, roster=None):
+    return values(self.problem, self.roster if roster is None else roster)
+
+
+def versions_of(problem, roster):
+  """(weeks, days, areas) schedule version of each cell."""
+  num_versions = len(problem.versions)
+  num_weeks, num_days, num_areas = roster.shape
+  result = np.zeros(roster.shape, dtype=np.int64)
+  for a, area in enumerate(problem.areas):
+    required = [problem.curriculum[schedule, area]
+                for schedule in problem.schedules for v in range(num_versions)]
+    if sum(required) != num_days:
+      raise ValueError('area %s: the curriculum doesn\'t add up to %i days' % (
+          area, num_days))
+    result[:, :, a] = np.repeat(np.arange(len(required)), required)
+  return result
+
+
+def values(problem, roster):
+  """Assignment tensor (schedule_version, week, area, doctor, day) of a roster."""
+  num_weeks, num_days, num_areas = roster.shape
+  num_schedule_versions = len(problem.schedules) * len(problem.versions)
+  result = np.zeros((num_schedule_versions, num_weeks, num_areas,
+                     len(problem.doctors), num_days), dtype=np.int8)
+  w, day, a = np.nonzero(roster >= 0)
+  sv = versions_of(problem, roster)[w, day, a]
+  result[sv, w, a, roster[w, day, a], day] = 1
+  return result
@@ -1,10 +1,24 @@
+import collections
+import math
+
+import numpy as np
 from ortools.sat.python import cp_model
 
+from feasibility import check_feasibility
+from heuristics import construct_roster
+from model_cache import fingerprint
+from presolve import Presolve
+from problem_arrays import HospitalArrays
+from sat_solver import A_FEW_SOLUTIONS, SatSolver
+from solution_sinks import MultiplicitySink
+from telemetry import Telemetry
+from var_tensor import VarTensor
+
 
 class HospitalSchedulingProblem(object):
 
   def __init__(self, areas, doctors, curriculum, specialties, weeks, working_days,
-               schedules, versions, doctor_work_days):
+               schedules, versions, doctor_work_days, doctor_unavailable=None):
     self.areas = areas
     self.doctors = doctors
     self.curriculum = curriculum
@@ -14,13 +28,48 @@ class HospitalSchedulingProblem(object):
     self.schedules = schedules
     self.versions = versions
     self.doctor_work_days = doctor_work_days
+    # (doctor, week, day) index triples the doctor can't work, e.g. sick days
+    self.doctor_unavailable = set(doctor_unavailable or ())
+
 
+class HospitalSchedulingHistory(object):
+  # What happened before the first week of a problem, carried between the
+  # windows of a rolling horizon (see rolling_horizon.py)
 
-class HospitalSchedulingSatSolver(object):
+  def __init__(self, doctor_load, recent_areas):
+    # Days worked per doctor so far
+    self.doctor_load = doctor_load
+    # Per doctor, the area index worked on each of the most recent days
+    # (oldest first), -1 for a day off
+    self.recent_areas = recent_areas
 
-  def __init__(self, problem):
+
+class HospitalSchedulingSatSolver(SatSolver):
+
+  def __init__(self, problem, sparse=False, var_names=True, history=None,
+               cache=None, telemetry=None, explain=False, presolve=False):
     # Problem
     self.problem = problem
+    self.history = history
+    self.sparse = sparse
+    self.var_names = var_names
+    # With explain=True every constraint is guarded by a literal, see explain()
+    self.explaining = explain
+    self.guards = []
+    # Phase timers and search progress, see print_status()
+    self.telemetry = Telemetry() if telemetry is None else telemetry
+    # Forced cells and pairs ruled out before the build, see presolve.py
+    self.presolve = None
+    # One line summary, printed by print_status()
+    self.presolve_summary = None
+    if presolve:
+      # Not 'presolve', the CP-SAT presolve is timed under that name
+      with self.telemetry.phase('model presolve'):
+        self.presolve = Presolve(problem)
+      self.presolve_summary = str(self.presolve)
+      if not self.presolve.feasible:
+        # Left to the search to prove
+        self.presolve = None
 
     # Utilities
     
@@ -46,70 +95,128 @@ class HospitalSchedulingSatSolver(object):
     all_areas = range(self.num_areas)
     all_schedules = range(self.num_schedules)
 
+    # Eligibility index: area -> doctors that get a variable, doctor -> areas.
+    # In sparse mode only the (area, doctor) pairs listed in the specialties
+    # exist, in dense mode every pair does and the ineligible ones are fixed to 0
+    self.arrays = HospitalArrays(problem)
+    # (area, doctor) -> eligible
+    self.eligible = self.arrays.specialty
+    # (week, area, doctor, day) -> gets a decision
+    if self.presolve is not None:
+      self.possible = self.presolve.candidates
+    else:
+      self.possible = self.arrays.possible()
+    if sparse:
+      self.area_doctors = [np.nonzero(self.eligible[a])[0].tolist() for a in all_areas]
+    else:
+      self.area_doctors = [list(all_doctors) for a in all_areas]
+    self.doctor_areas = [[] for d in all_doctors]
+    for a in all_areas:
+      for d in self.area_doctors[a]:
+        self.doctor_areas[d].append(a)
+
     self.model = cp_model.CpModel()
 
     # build all the possible permutations including the specialties
-    self.assignment = {}
-    for sv in all_schedule_versions:
-      for w in all_weeks:
-        for a in all_areas:
-          for d in all_doctors:
-            for day in all_days:
-              if d in self.problem.specialties[a]:
-                name = 'C:{%i} W:{%i} S:{%i} T:{%i} Slot:{%i}' % (sv, w, a, d, day)
-                # print(name)
-                self.assignment[sv, w, a, d, day] = self.model.NewBoolVar(name)
-              else:
-                name = 'NO DISP C:{%i} W:{%i} S:{%i} T:{%i} Slot:{%i}' % (sv, w, a, d, day)
-                # print(name)
-                self.assignment[sv, w, a, d, day] = self.model.NewIntVar(0, 0, name)
+    self.assignment = VarTensor(
+        ('schedule_version', 'week', 'area', 'doctor', 'day'),
+        (self.num_schedule_versions, self.num_weeks, self.num_areas,
+         self.num_doctors, self.num_days))
+    self.cache_key = None
+    arrays = None
+    # The guards aren't part of the cached model
+    if explain:
+      cache = None
+    if cache is not None:
+      # Options that change the model are part of the key, the history only
+      # enters the objectives, which are added after the build
+      self.cache_key = fingerprint(problem, sparse=sparse, var_names=var_names,
+                                   presolve=presolve)
+      with self.telemetry.phase('cache load'):
+        arrays = cache.load(self.cache_key, self.model)
+        if arrays is not None:
+          self.assignment.restore(self.model, arrays['indices'])
+          self.live = arrays['live']
+    if arrays is None:
+      self.build_model()
+      if cache is not None:
+        with self.telemetry.phase('cache store'):
+          cache.store(self.cache_key, self.model,
+                      indices=self.assignment.proto_indices(), live=self.live)
+    self.telemetry.record_model(self.model)
+
+    # Solution collector
+    self.collector = None
+    self.status = None
+
+    # Interchangeable weeks / schedule versions ordered by break_symmetries()
+    self.week_groups = []
+    self.version_groups = []
+
+  def build_model(self):
+    all_schedule_versions = range(self.num_schedule_versions)
+    all_weeks = range(self.num_weeks)
+    all_days = range(self.num_days)
+    all_areas = range(self.num_areas)
+
+    telemetry = self.telemetry
+
+    # Cells holding a decision, as opposed to the fixed zeros of the dense layout
+    self.live = np.zeros(self.assignment.shape, dtype=bool)
+    # With a single schedule version the cells fixed by the presolve all hold
+    # this constant
+    decided = None
+    if self.presolve is not None and self.num_schedule_versions == 1:
+      decided = self.presolve.fixed
+      one = self.model.NewConstant(1)
+    with telemetry.phase('variables'):
+      for sv in all_schedule_versions:
+        for w in all_weeks:
+          for a in all_areas:
+            for d in self.area_doctors[a]:
+              for day in all_days:
+                key = (sv, w, a, d, day)
+                if decided is not None and decided[w, a, day] == d:
+                  self.assignment[key] = one
+                elif self.available(key):
+                  self.assignment[key] = self.model.NewBoolVar(self.var_name(key))
+                  self.live[key] = True
+                elif not self.sparse:
+                  self.assignment[key] = self.model.NewIntVar(0, 0, self.var_name(key))
 
     # Constraints
 
     # Each schedule/version must have the quantity of areas specified in the curriculum
     # 8/15: All areas are required 5 days of the week
-    for sch in all_schedules:
-      for ver in all_versions:
-        sch_ver = sch * self.num_versions + ver
-        for week in all_weeks: 
-          for area in all_areas:
-            required_days = self.problem.curriculum[self.problem.schedules[
-                sch], self.problem.areas[area]]
-            self.model.Add(
-                sum(self.assignment[sch_ver, week, area, doctor, day]
-                    for day in all_days
-                    for doctor in all_doctors) == required_days)
+    with telemetry.phase('curriculum'):
+      for (sch_ver, week, area), expr in self.assignment.sums(over=('doctor', 'day')):
+        sch = sch_ver // self.num_versions
+        required_days = int(self.arrays.curriculum[sch, area])
+        self.require(self.model.Add(expr == required_days), 'curriculum',
+                     (sch_ver, week, area))
 
     # Doctor can work at only one area at a time (per day)
-    for doctor in all_doctors:
-      for week in all_weeks:
-        for day in all_days:
-          self.model.Add(
-              sum([
-                  self.assignment[sv, week, a, doctor, day]
-                  for sv in all_schedule_versions
-                  for a in all_areas
-              ]) <= 1)
+    with telemetry.phase('one area per day'):
+      for (week, doctor, day), expr in self.assignment.sums(over=('schedule_version', 'area')):
+        # A doctor fixed that day has no other cell left
+        if decided is not None and (decided[week, :, day] == doctor).any():
+          continue
+        self.require(self.model.Add(expr <= 1), 'one area per day',
+                     (week, doctor, day))
 
     # Ensure that each day of the week is accounted for and no duplicate days
-    for week in all_weeks:
-      for day in all_days:
-        for a in all_areas:
-          self.model.Add(
-              sum([
-                  self.assignment[sv, week, a, d, day]
-                  for sv in all_schedule_versions
-                  for d in all_doctors
-              ]) == 1)
+    with telemetry.phase('daily coverage'):
+      for (week, a, day), expr in self.assignment.sums(over=('schedule_version', 'doctor')):
+        if decided is not None and decided[week, a, day] >= 0:
+          continue
+        self.require(self.model.Add(expr == 1), 'daily coverage', (week, a, day))
 
     # Maximum work days for each doctor
-    for week in all_weeks:
-      for doctor in all_doctors:
-        self.model.Add(
-            sum([self.assignment[sv, week, a, doctor, day] for sv in all_schedule_versions
-                for a in all_areas for day in all_days
-            ]) <= self.problem.doctor_work_days[doctor])
-    
+    with telemetry.phase('max work days'):
+      for (week, doctor), expr in self.assignment.sums(over=('schedule_version', 'area', 'day')):
+        self.require(self.model.Add(expr <= int(self.arrays.work_days[doctor])),
+                     'max work days', (week, doctor))
+
 
     # Doctor makes all the classes of a area's course
     # So if Ian can teach math and history, he can only teach it in his course
@@ -131,30 +238,298 @@ class HospitalSchedulingSatSolver(object):
     #           sum(doctor_schedule_versions[course, area, t]
     #               for t in all_doctors) == 1)
 
-    # Solution collector
-    self.collector = None
-
-  def solve(self):
-    print('Solving')
-    a_few_solutions = [1, 2, 100, 1000, 5000, 50000, 100000, 2000000]
-
+  def require(self, constraint, family, key):
+    # In explain mode the constraint only holds when its guard is assumed
+    if self.explaining:
+      guard = self.model.NewBoolVar('%s %s' % (family, key) if self.var_names else '')
+      constraint.OnlyEnforceIf(guard)
+      self.guards.append((guard, family, key))
+
+  def explain(self, time_limit=None):
+    """Returns an Explanation of why the roster is infeasible, None if it isn't.
+
+    Solves once with every guard as an assumption; when infeasible CP-SAT
+    reports a subset of the assumptions that is already infeasible on its
+    own, usually a handful of constraints. The subset is sufficient, not
+    necessarily minimal. Eligibility and availability aren't guarded, they
+    decide which variables exist.
+    """
+    if not self.explaining:
+      raise ValueError('explain() needs HospitalSchedulingSatSolver(..., explain=True)')
+    self.model.ClearAssumptions()
+    self.model.AddAssumptions([guard for guard, _, _ in self.guards])
     solver = cp_model.CpSolver()
-    solution_printer = HospitalSchedulingSatSolutionPrinter(self.assignment, self.problem.weeks, self.problem.working_days,
-      self.problem.doctors, self.problem.areas, self.problem.schedules, self.problem.versions, self.num_schedule_versions, a_few_solutions)
-    status = solver.SearchForAllSolutions(self.model, solution_printer)
-    print('- Statistics')
-    print('  - Branches', solver.NumBranches())
-    print('  - Conflicts', solver.NumConflicts())
-    print('  - WallTime', solver.WallTime())
-    print('  - solutions found : %i' % solution_printer.SolutionCount())
+    # The assumption core is only reported by the sequential search
+    solver.parameters.num_search_workers = 1
+    if time_limit is not None:
+      solver.parameters.max_time_in_seconds = time_limit
+    with self.telemetry.solving(solver):
+      self.status = solver.Solve(self.model)
+    self.model.ClearAssumptions()
+    if self.status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+      return None
+    explanation = Explanation(self.status == cp_model.INFEASIBLE)
+    if explanation.proven:
+      # The core comes back as model variable indices
+      by_index = {guard.Index(): (family, key) for guard, family, key in self.guards}
+      for index in solver.SufficientAssumptionsForInfeasibility():
+        family, key = by_index[index]
+        explanation.add(family, self.describe(family, key))
+    return explanation
+
+  def describe(self, family, key):
+    p = self.problem
+    if family == 'curriculum':
+      sv, w, a = key
+      return '%s needs %i days of schedule %s%s in %s' % (
+          p.areas[a], p.curriculum[p.schedules[sv // self.num_versions], p.areas[a]],
+          p.schedules[sv // self.num_versions], p.versions[sv % self.num_versions],
+          p.weeks[w])
+    if family == 'one area per day':
+      w, d, day = key
+      return '%s works one area at a time on %s of %s' % (
+          p.doctors[d], p.working_days[day], p.weeks[w])
+    if family == 'daily coverage':
+      w, a, day = key
+      return '%s is covered on %s of %s' % (p.areas[a], p.working_days[day], p.weeks[w])
+    w, d = key
+    return '%s works at most %i days in %s' % (
+        p.doctors[d], p.doctor_work_days[d], p.weeks[w])
+
+  def available(self, key):
+    sv, w, a, d, day = key
+    return bool(self.possible[w, a, d, day])
+
+  def var_name(self, key):
+    # Names are only needed when debugging the model, building a string per
+    # variable is a noticeable part of the build time on large rosters
+    if not self.var_names:
+      return ''
+    sv, w, a, d, day = key
+    prefix = '' if self.available(key) else 'NO DISP '
+    return prefix + self.key_name(key)
+
+  def solve(self, mode='enumerate', objective=None, num_search_workers=8,
+            time_limit=None, random_seed=None, sink=None, warm_start=False):
+    # mode='enumerate' walks every solution and prints a few of them, or
+    # hands them to `sink` (see solution_sinks) and returns the count,
+    # mode='optimize' runs a parallel search and returns one roster,
+    # mode='heuristic' returns the constructed roster of heuristics.py
+    # without searching
+    if mode == 'heuristic':
+      with self.telemetry.phase('construction'):
+        return construct_roster(self.problem, self.history)
+    if mode == 'optimize':
+      return self.optimize(objective, num_search_workers, time_limit,
+                           random_seed, warm_start)
+
+    # With symmetry breaking only one solution per orbit is enumerated, the
+    # multiplicity of each one is added up to recover the true count
+    counter = None
+    if self.week_groups or self.version_groups:
+      counter = sink = MultiplicitySink(self.multiplicity, sink)
+
+    count = self.enumerate(sink, time_limit)
+    if counter is not None:
+      print('  - solutions without symmetry breaking : %i' % counter.total)
+      if count:
+        print('  - multiplicity factor : %.2f' % (counter.total / count))
+      return counter.total
+    return count
+
+  def solution_printer(self):
+    return HospitalSchedulingSatSolutionPrinter(self.assignment, self.problem.weeks, self.problem.working_days,
+      self.problem.doctors, self.problem.areas, self.problem.schedules, self.problem.versions, self.num_schedule_versions, A_FEW_SOLUTIONS)
+
+  def break_symmetries(self, weeks=True, versions=True):
+    # Opt-in. Every constraint is per week and the versions of a schedule
+    # share its curriculum, so any solution permuted across weeks, or across
+    # the versions of a schedule within a week, is found again. Interchangeable
+    # blocks are kept in lexicographic order so each orbit is enumerated once;
+    # solve() adds up multiplicity() to report the true count. Only valid as
+    # long as no constraint couples weeks or tells versions apart.
+    with self.telemetry.phase('symmetry breaking'):
+      values = self.assignment.vars
+      # Blocks are compared on their decisions, the fixed zeros of the dense
+      # layout are left out
+      mask = self.live
+      if versions:
+        for sch in range(self.num_schedules):
+          svs = [sch * self.num_versions + v for v in range(self.num_versions)]
+          for w in range(self.num_weeks):
+            for group in identical_blocks(svs, lambda sv: mask[sv, w]):
+              self.version_groups.append([(sv, w) for sv in group])
+              for a, b in zip(group, group[1:]):
+                add_lex_less_equal(self.model, values[a, w][mask[a, w]],
+                                   values[b, w][mask[b, w]])
+      if weeks:
+        for group in identical_blocks(range(self.num_weeks), lambda w: mask[:, w]):
+          self.week_groups.append(group)
+          for a, b in zip(group, group[1:]):
+            add_lex_less_equal(self.model, values[:, a][mask[:, a]],
+                               values[:, b][mask[:, b]])
+
+  def multiplicity(self, values):
+    # Number of solutions of the unbroken model this canonical one stands for
+    factor = 1
+    for group in self.version_groups:
+      factor *= permutations_of([values[key].tobytes() for key in group])
+    for group in self.week_groups:
+      factor *= permutations_of([values[:, w].tobytes() for w in group])
+    return factor
+
+  def optimize(self, objective=None, num_search_workers=8, time_limit=None,
+               random_seed=None, warm_start=False):
+    # Returns the 0/1 values of the assignment tensor for the best roster
+    # found, or None when the search ends without one. The objective is the
+    # name of one of objectives() or a callable(solver) returning the
+    # expression to minimize. With warm_start the constructed roster of
+    # heuristics.py is given as hints, and returned when the search stops
+    # (e.g. on the time limit) before finding a roster of its own
+    start = None
+    if warm_start:
+      with self.telemetry.phase('construction'):
+        start = construct_roster(self.problem, self.history)
+      if start is not None:
+        self.add_hints(start)
+    solver = self.search(objective, num_search_workers, time_limit, random_seed)
+    if self.status == cp_model.UNKNOWN and start is not None:
+      print('  - No roster found, returning the constructed one')
+      return start
+    if not self.found():
+      return None
+    return self.assignment.values_from(solver.ResponseProto().solution)
+
+  def add_hints(self, values, weeks=None):
+    # Solution hints from a 0/1 array shaped like the assignment tensor, e.g.
+    # an earlier result of optimize(). When values only covers some weeks,
+    # `weeks` lists which ones, in order
+    if weeks is None:
+      weeks = range(self.num_weeks)
+    for i, w in enumerate(weeks):
+      mask = self.live[:, w]
+      for var, value in zip(self.assignment.vars[:, w][mask],
+                            values[:, i][mask].tolist()):
+        self.model.AddHint(var, value)
+
+  def objectives(self):
+    return {
+        'balance_workdays': self.balance_workdays_objective,
+        'min_max_usage': self.max_usage_objective,
+    }
+
+  def doctor_loads(self):
+    # (week, doctor) -> number of days worked, one expression per pair
+    return dict(self.assignment.sums(over=('schedule_version', 'area', 'day')))
+
+  def balance_workdays_objective(self):
+    # Spread between the busiest and the least busy doctor over the horizon,
+    # doctors without any specialty can't take days and are left out. Days
+    # worked before the first week (history) count towards the totals
+    loads = self.doctor_loads()
+    prior = [0] * self.num_doctors
+    if self.history is not None:
+      prior = [int(x) for x in self.history.doctor_load]
+    horizon = self.num_weeks * self.num_days + max(prior)
+    totals = []
+    for d in range(self.num_doctors):
+      if not self.eligible[:, d].any():
+        continue
+      total = self.model.NewIntVar(0, horizon, '')
+      self.model.Add(total == prior[d] + cp_model.LinearExpr.Sum(
+          [loads[w, d] for w in range(self.num_weeks)]))
+      totals.append(total)
+    busiest = self.model.NewIntVar(0, horizon, 'busiest')
+    idlest = self.model.NewIntVar(0, horizon, 'idlest')
+    self.model.AddMaxEquality(busiest, totals)
+    self.model.AddMinEquality(idlest, totals)
+    return busiest - idlest
+
+  def max_usage_objective(self):
+    # Number of (week, doctor) pairs where the doctor works all of their
+    # doctor_work_days
+    at_max = []
+    for (w, d), load in self.doctor_loads().items():
+      full = self.model.NewBoolVar('')
+      self.model.Add(load <= int(self.arrays.work_days[d]) - 1 + full)
+      at_max.append(full)
+    return cp_model.LinearExpr.Sum(at_max)
+
+  def print_solution(self, values):
+    for sv, w, a, d, day in zip(*values.nonzero()):
+      print(' Schedule #%i | Week #%s | Area #%s | Doctor #%s | Day #%s' % (
+          sv, self.problem.weeks[w], self.problem.areas[a],
+          self.problem.doctors[d], self.problem.working_days[day]))
 
   def print_status(self):
-    pass
+    if self.presolve_summary is not None:
+      print(self.presolve_summary)
+    SatSolver.print_status(self)
+
+
+class Explanation(object):
+  # Constraints that can't all hold together, see explain()
+
+  def __init__(self, proven):
+    # False when the search stopped before proving infeasibility
+    self.proven = proven
+    # family -> descriptions, e.g. 'daily coverage' -> ['SFH IR is covered on...']
+    self.conflicts = collections.OrderedDict()
+
+  def add(self, family, description):
+    self.conflicts.setdefault(family, []).append(description)
+
+  def __len__(self):
+    return sum(len(x) for x in self.conflicts.values())
+
+  def __str__(self):
+    if not self.proven:
+      return 'Unknown: the search stopped before proving infeasibility'
+    lines = ['Infeasible: these %i constraints can\'t all hold' % len(self)]
+    for family, descriptions in self.conflicts.items():
+      lines.append('  - %s' % family)
+      for description in descriptions:
+        lines.append('    - %s' % description)
+    return '\n'.join(lines)
+
+
+def identical_blocks(keys, block_mask):
+  # Groups keys whose blocks have the same variable layout, only those can be
+  # swapped
+  groups = collections.OrderedDict()
+  for key in keys:
+    groups.setdefault(block_mask(key).tobytes(), []).append(key)
+  return [group for group in groups.values() if len(group) > 1]
+
+
+def permutations_of(blocks):
+  # Distinct orderings of a multiset: n! / prod(count!)
+  count = math.factorial(len(blocks))
+  for c in collections.Counter(blocks).values():
+    count //= math.factorial(c)
+  return count
+
+
+def add_lex_less_equal(model, xs, ys):
+  # xs <=lex ys over Boolean vectors. eq[i] is true iff the first i entries
+  # are equal, it is fully determined by xs and ys so enumeration doesn't see
+  # extra solutions through it
+  eq = model.NewConstant(1)
+  for x, y in zip(xs, ys):
+    model.AddBoolOr([eq.Not(), x.Not(), y])
+    nxt = model.NewBoolVar('')
+    model.AddImplication(nxt, eq)
+    model.AddBoolOr([nxt.Not(), x.Not(), y])
+    model.AddBoolOr([nxt.Not(), x, y.Not()])
+    model.AddBoolOr([eq.Not(), x, y, nxt])
+    model.AddBoolOr([eq.Not(), x.Not(), y.Not(), nxt])
+    eq = nxt
 
 
 class HospitalSchedulingSatSolutionPrinter(cp_model.CpSolverSolutionCallback):
 
   def __init__(self, assignment, weeks, working_days, doctors, areas, schedules, versions, num_schedule_versions, sols):
+    cp_model.CpSolverSolutionCallback.__init__(self)
 
     self.__weeks = weeks
     self.__working_days = working_days
@@ -180,19 +555,19 @@ class HospitalSchedulingSatSolutionPrinter(cp_model.CpSolverSolutionCallback):
       print('\n')
       print('Solution #%i' % self.__solution_count)
       
-      for sv in range(self.__num_schedule_versions):
-        for w in range(self.__num_weeks):
-          for a in range(self.__num_areas):
-            for d in range(self.__num_doctors):
-              for ts in range(self.__num_days):
-                if self.Value(self.__assignment[(sv, w, a, d, ts)]):
-                  area_name = self.__areas[a]
-                  doctor_name = self.__doctors[d]
-                  week_name = self.__weeks[w]
-                  day_name = self.__working_days[ts]
-                  print(' Schedule #%i | Week #%s | Area #%s | Doctor #%s | Day #%s' % (sv, week_name, area_name, doctor_name, day_name))
+      # Read the whole solution in one call and walk the cells set to 1, in
+      # sparse mode the ineligible pairs have no cell at all
+      values = self.__assignment.values_from(self.Response().solution)
+      for sv, w, a, d, ts in zip(*values.nonzero()):
+        area_name = self.__areas[a]
+        doctor_name = self.__doctors[d]
+        week_name = self.__weeks[w]
+        day_name = self.__working_days[ts]
+        print(' Schedule #%i | Week #%s | Area #%s | Doctor #%s | Day #%s' % (sv, week_name, area_name, doctor_name, day_name))
       print('\n')
 
+  on_solution_callback = NewSolution
+
   def SolutionCount(self):
     return self.__solution_count
 
@@ -255,7 +630,13 @@ def main():
   problem = HospitalSchedulingProblem(
       areas, doctors, curriculum, specialties_idx_inverse, weeks, working_days,
       schedules, versions, doctors_work_days)
-  solver = HospitalSchedulingSatSolver(problem)
+  # Fail fast on curriculum/specialty combinations that can't be satisfied
+  report = check_feasibility(problem)
+  print(report)
+  if not report.feasible:
+    print(HospitalSchedulingSatSolver(problem, sparse=True, explain=True).explain())
+    return
+  solver = HospitalSchedulingSatSolver(problem, sparse=True)
   solver.solve()
   solver.print_status()
 
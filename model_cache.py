@@ -0,0 +1,130 @@
+"""On-disk cache of compiled CP-SAT models.
+
+The same CpModel is rebuilt many times a day from nearly identical problems
+and the Python construction loops are a noticeable share of the latency. A
+ModelCache keeps, per problem fingerprint, the model proto and the variable
+index map of the assignment tensor. A solver given a cache looks the
+fingerprint up first and, on a hit, parses the proto and rebuilds the tensor
+from the index map instead of running its construction loops.
+
+The fingerprint is a SHA-256 of a canonical JSON dump of the problem data and
+of the solver options that change the model. Entries are directories under
+the cache directory; the least recently used ones are evicted once the cache
+grows past max_bytes.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from ortools.sat.python import cp_model_helper
+
+
+# Bump when the model built for a given problem changes shape
+FORMAT_VERSION = 1
+
+MODEL_FILE = 'model.txt'
+INDEX_FILE = 'index.npz'
+
+
+def canonical(value):
+  # JSON-able, order independent where the order carries no meaning
+  if isinstance(value, dict):
+    return sorted([canonical(k), canonical(v)] for k, v in value.items())
+  if isinstance(value, (set, frozenset)):
+    return sorted(canonical(v) for v in value)
+  if isinstance(value, (list, tuple, range)):
+    return [canonical(v) for v in value]
+  if isinstance(value, np.ndarray):
+    return value.tolist()
+  if isinstance(value, np.generic):
+    return value.item()
+  return value
+
+
+def fingerprint(problem, **options):
+  data = {
+      'format': FORMAT_VERSION,
+      'problem': type(problem).__name__,
+      'data': canonical(vars(problem)),
+      'options': canonical(options),
+  }
+  text = json.dumps(data, sort_keys=True, separators=(',', ':'))
+  return hashlib.sha256(text.encode()).hexdigest()
+
+
+class ModelCache(object):
+
+  def __init__(self, directory, max_bytes=512 << 20):
+    self.directory = directory
+    self.max_bytes = max_bytes
+    os.makedirs(directory, exist_ok=True)
+
+  def path(self, key):
+    return os.path.join(self.directory, key)
+
+  def load(self, key, model):
+    """Parses the cached proto into `model` and returns its index arrays.
+
+    Returns None on a miss, `model` is left untouched then.
+    """
+    path = self.path(key)
+    try:
+      with open(os.path.join(path, MODEL_FILE)) as f:
+        text = f.read()
+      with np.load(os.path.join(path, INDEX_FILE)) as index:
+        arrays = dict(index)
+    except (IOError, OSError, ValueError):
+      return None
+    # Parsed aside first: a corrupt or truncated entry is a miss, and dropped
+    proto = cp_model_helper.CpModelProto()
+    if not proto.parse_text_format(text) or not len(proto.variables):
+      shutil.rmtree(path, ignore_errors=True)
+      return None
+    model.Proto().copy_from(proto)
+    # Mark the entry as recently used
+    os.utime(path)
+    return arrays
+
+  def store(self, key, model, **arrays):
+    # Written to a temporary directory first and renamed, so readers never
+    # see half an entry
+    tmp = tempfile.mkdtemp(dir=self.directory, prefix='.tmp-')
+    try:
+      cp_model_helper.CpSatHelper.write_model_to_file(
+          model.Proto(), os.path.join(tmp, MODEL_FILE))
+      np.savez(os.path.join(tmp, INDEX_FILE), **arrays)
+      os.rename(tmp, self.path(key))
+    except OSError:
+      # Another process stored the same key first
+      shutil.rmtree(tmp, ignore_errors=True)
+    self.evict()
+
+  def entries(self):
+    # [(last used, size in bytes, key)], oldest first
+    result = []
+    for key in os.listdir(self.directory):
+      path = self.path(key)
+      if key.startswith('.') or not os.path.isdir(path):
+        continue
+      size = sum(os.path.getsize(os.path.join(path, name))
+                 for name in os.listdir(path))
+      result.append((os.path.getmtime(path), size, key))
+    return sorted(result)
+
+  def evict(self):
+    entries = self.entries()
+    total = sum(size for _, size, _ in entries)
+    for _, size, key in entries:
+      if total <= self.max_bytes:
+        break
+      shutil.rmtree(self.path(key), ignore_errors=True)
+      total -= size
+
+  def clear(self):
+    for _, _, key in self.entries():
+      shutil.rmtree(self.path(key), ignore_errors=True)
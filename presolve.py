@@ -0,0 +1,112 @@
+"""Reductions of a HospitalSchedulingProblem before the model is built.
+
+Many areas have a single eligible doctor (SJH Dx/IR -> Simon, SFH IR ->
+Hamblin), so their cells are decided before any search, yet the model gets a
+variable and a constraint for each of them. Presolve works on the
+(week, area, doctor, day) pairs that can still be assigned and repeats, until
+nothing changes:
+
+  - single candidate: an (area, day) cell with one doctor left is fixed to
+    that doctor
+  - fixed days: a doctor fixed to a cell is removed from every other area
+    that day
+  - saturated capacity: a doctor whose fixed cells use up doctor_work_days in
+    a week is removed from the other cells of the week
+
+A cell without any doctor left, or two cells fixed to the same doctor on the
+same day, or more fixed cells than work days, make the roster infeasible;
+`feasible` is False then and `reason` tells why.
+
+HospitalSchedulingSatSolver(problem, presolve=True) only creates variables
+for the pairs left. With a single schedule version the fixed cells need no
+variable at all: they hold one shared constant, so the solutions read from
+the assignment tensor include them, and their coverage and one-area-per-day
+constraints, true by construction, are left out.
+"""
+
+import numpy as np
+
+from problem_arrays import HospitalArrays
+
+
+class Presolve(object):
+
+  def __init__(self, problem):
+    self.problem = problem
+    num_weeks = len(problem.weeks)
+    num_areas = len(problem.areas)
+    num_days = len(problem.working_days)
+
+    # (week, area, doctor, day) pairs still possible
+    arrays = HospitalArrays(problem)
+    self.candidates = arrays.possible()
+    self.initial = int(self.candidates.sum())
+    # (week, area, day) -> fixed doctor, -1 while open
+    self.fixed = np.full((num_weeks, num_areas, num_days), -1, dtype=np.int64)
+    # (week, doctor) work days left besides the fixed cells
+    self.capacity = np.tile(arrays.work_days, (num_weeks, 1))
+    self.feasible = True
+    self.reason = None
+    self.rounds = 0
+    self.run()
+
+  def infeasible(self, reason):
+    self.feasible = False
+    self.reason = reason
+
+  def run(self):
+    p = self.problem
+    while self.feasible:
+      self.rounds += 1
+      changed = False
+      open_cells = self.fixed < 0
+      counts = self.candidates.sum(axis=2)
+      empty = np.argwhere(open_cells & (counts == 0))
+      if len(empty):
+        w, a, day = empty[0]
+        self.infeasible('no doctor left for %s on %s of %s' % (
+            p.areas[a], p.working_days[day], p.weeks[w]))
+        return
+
+      # Single candidates
+      w, a, day = np.nonzero(open_cells & (counts == 1))
+      if len(w):
+        d = self.candidates[w, a, :, day].argmax(axis=1)
+        _, first, times = np.unique(np.stack([w, d, day], axis=1), axis=0,
+                                    return_index=True, return_counts=True)
+        if (times > 1).any():
+          i = first[np.argmax(times > 1)]
+          self.infeasible('%s is the only doctor left for two areas on %s of %s' % (
+              p.doctors[d[i]], p.working_days[day[i]], p.weeks[w[i]]))
+          return
+        self.fixed[w, a, day] = d
+        np.subtract.at(self.capacity, (w, d), 1)
+        over = np.argwhere(self.capacity < 0)
+        if len(over):
+          week, doctor = over[0]
+          self.infeasible('%s is the only doctor left for more than %i days of %s' % (
+              p.doctors[doctor], p.doctor_work_days[doctor], p.weeks[week]))
+          return
+        # Fixed days: the doctor is taken for every other area that day
+        busy = np.zeros(self.capacity.shape + (self.fixed.shape[2],), dtype=bool)
+        busy[w, d, day] = True
+        self.candidates &= ~(busy[:, np.newaxis] & (self.fixed < 0)[:, :, np.newaxis])
+        changed = True
+
+      # Saturated capacity
+      full = (self.capacity == 0)[:, np.newaxis, :, np.newaxis]
+      clear = full & (self.fixed < 0)[:, :, np.newaxis] & self.candidates
+      if clear.any():
+        self.candidates &= ~clear
+        changed = True
+      if not changed:
+        return
+
+  def __str__(self):
+    if not self.feasible:
+      return 'Presolve: infeasible, %s' % self.reason
+    open_pairs = self.candidates & (self.fixed < 0)[:, :, np.newaxis]
+    return ('Presolve: %i of %i cells fixed, %i of %i (week, area, doctor, day) '
+            'pairs left open after %i rounds' % (
+                int((self.fixed >= 0).sum()), self.fixed.size,
+                int(open_pairs.sum()), self.initial, self.rounds))
@@ -0,0 +1,58 @@
+"""Integer-indexed NumPy form of the problems.
+
+The problem classes keep the names, a tuple-keyed curriculum dict and the
+specialties as lists. The solvers index those once into arrays: a dense
+curriculum, a boolean specialty matrix, the work limits and, for the
+hospital, the unavailable (doctor, week, day) cells. The curriculum, work
+limit and eligibility constraints read them by index instead of looking the
+names up in the curriculum dict or scanning the specialty lists.
+"""
+
+import numpy as np
+
+
+class HospitalArrays(object):
+
+  def __init__(self, problem):
+    index = dict((name, i) for i, name in enumerate(problem.areas))
+    schedules = dict((name, i) for i, name in enumerate(problem.schedules))
+    num_doctors = len(problem.doctors)
+    # (schedule, area) -> days per schedule version and week
+    self.curriculum = np.zeros((len(schedules), len(index)), dtype=np.int64)
+    for (schedule, area), days in problem.curriculum.items():
+      if schedule in schedules and area in index:
+        self.curriculum[schedules[schedule], index[area]] = days
+    # (area, doctor) -> eligible
+    self.specialty = np.zeros((len(index), num_doctors), dtype=bool)
+    for a, doctors in enumerate(problem.specialties):
+      self.specialty[a, list(doctors)] = True
+    self.work_days = np.array(problem.doctor_work_days, dtype=np.int64)
+    # (doctor, week, day) -> can't work
+    self.unavailable = np.zeros(
+        (num_doctors, len(problem.weeks), len(problem.working_days)), dtype=bool)
+    if problem.doctor_unavailable:
+      self.unavailable[tuple(np.array(sorted(problem.doctor_unavailable)).T)] = True
+
+  def possible(self):
+    # (week, area, doctor, day) -> eligible and available
+    return (self.specialty[np.newaxis, :, :, np.newaxis] &
+            ~self.unavailable.transpose(1, 0, 2)[:, np.newaxis])
+
+
+class SchoolArrays(object):
+
+  def __init__(self, problem):
+    index = dict((name, i) for i, name in enumerate(problem.subjects))
+    # (level, subject) -> classes per course, school_2 has no levels
+    self.curriculum = None
+    if hasattr(problem, 'levels'):
+      levels = dict((name, i) for i, name in enumerate(problem.levels))
+      self.curriculum = np.zeros((len(levels), len(index)), dtype=np.int64)
+      for (level, subject), hours in problem.curriculum.items():
+        if level in levels and subject in index:
+          self.curriculum[levels[level], index[subject]] = hours
+    # (subject, teacher) -> eligible
+    self.specialty = np.zeros((len(index), len(problem.teachers)), dtype=bool)
+    for s, teachers in enumerate(problem.specialties):
+      self.specialty[s, list(teachers)] = True
+    self.work_hours = np.array(problem.teacher_work_hours, dtype=np.int64)
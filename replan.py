@@ -0,0 +1,63 @@
+"""Warm-started re-solve of a roster after disruptions.
+
+When a doctor calls in sick or an area's requirement changes, the roster
+doesn't need to be rebuilt from scratch. replan() applies a RosterChanges to
+the problem, gives the previous roster to CP-SAT as solution hints and, by
+default, minimizes the number of assignments that differ from it, so the
+search starts next to a known good answer and the schedule moves as little as
+possible.
+
+  previous = HospitalSchedulingSatSolver(problem, sparse=True).solve(mode='optimize')
+  changes = RosterChanges(unavailable=[(doctor, week, day)])
+  problem, roster = replan(problem, previous, changes)
+"""
+
+import copy
+
+from marko_weeks import HospitalSchedulingSatSolver
+
+
+class RosterChanges(object):
+
+  def __init__(self, unavailable=(), doctor_work_days=None, curriculum=None):
+    # (doctor, week, day) index triples the doctor can no longer work
+    self.unavailable = list(unavailable)
+    # doctor index -> new maximum work days per week
+    self.doctor_work_days = dict(doctor_work_days or {})
+    # (schedule, area) -> new required days, same keys as problem.curriculum
+    self.curriculum = dict(curriculum or {})
+
+
+def apply_changes(problem, changes):
+  # Returns a changed copy, the original problem is left untouched
+  changed = copy.copy(problem)
+  changed.doctor_unavailable = set(problem.doctor_unavailable) | set(changes.unavailable)
+  changed.doctor_work_days = list(problem.doctor_work_days)
+  for doctor, days in changes.doctor_work_days.items():
+    changed.doctor_work_days[doctor] = days
+  changed.curriculum = dict(problem.curriculum)
+  for key, days in changes.curriculum.items():
+    if key not in changed.curriculum:
+      raise KeyError('unknown curriculum entry %r' % (key,))
+    changed.curriculum[key] = days
+  return changed
+
+
+def replan(problem, previous, changes, minimize_changes=True,
+           num_search_workers=8, time_limit=None, random_seed=None):
+  """Re-solves `problem` after `changes`, starting from `previous`.
+
+  `previous` is the 0/1 array returned by solve(mode='optimize') on the
+  original problem. Returns (changed problem, new values), the values are None
+  when the changed problem has no roster.
+  """
+  changed = apply_changes(problem, changes)
+  solver = HospitalSchedulingSatSolver(changed, sparse=True, var_names=False)
+  solver.add_hints(previous)
+  objective = None
+  if minimize_changes:
+    objective = lambda s: s.hamming_distance(previous)
+  values = solver.solve(mode='optimize', objective=objective,
+                        num_search_workers=num_search_workers,
+                        time_limit=time_limit, random_seed=random_seed)
+  return changed, values
@@ -0,0 +1,101 @@
+"""Rolling-horizon driver for long multi-week rosters.
+
+HospitalSchedulingSatSolver builds one model over every week of the problem,
+so a quarter or a year of weeks makes a model, and a search, that keeps
+growing. RollingHorizonScheduler only ever builds a model for a window of K
+weeks: it solves the window, freezes its first week, slides one week forward
+and solves again. What the next window needs to know about the frozen weeks
+(days worked per doctor so far and the areas of the most recent days) is
+carried in a HospitalSchedulingHistory, and the unfrozen weeks of the previous
+window are passed as solution hints. Memory stays bounded by the window size
+and time grows linearly with the number of weeks.
+"""
+
+import numpy as np
+
+from marko_weeks import HospitalSchedulingHistory
+from marko_weeks import HospitalSchedulingProblem
+from marko_weeks import HospitalSchedulingSatSolver
+from rules import SequenceRules
+
+
+def window_problem(problem, start, stop):
+  # The same problem restricted to weeks [start, stop)
+  unavailable = [(d, w - start, day) for d, w, day in problem.doctor_unavailable
+                 if start <= w < stop]
+  return HospitalSchedulingProblem(
+      problem.areas, problem.doctors, problem.curriculum, problem.specialties,
+      problem.weeks[start:stop], problem.working_days, problem.schedules,
+      problem.versions, problem.doctor_work_days, unavailable)
+
+
+def frozen_history(history, week_values, recent_days):
+  # Adds a frozen week, shaped (schedule_version, area, doctor, day), to the
+  # boundary state
+  load = history.doctor_load + week_values.sum(axis=(0, 1, 3))
+  worked = week_values.sum(axis=0)  # (area, doctor, day)
+  areas = np.where(worked.any(axis=0), worked.argmax(axis=0), -1)  # (doctor, day)
+  recent = np.concatenate([history.recent_areas, areas], axis=1)
+  return HospitalSchedulingHistory(load, recent[:, -recent_days:])
+
+
+class RollingHorizonScheduler(object):
+
+  def __init__(self, problem, window=4, objective='balance_workdays',
+               num_search_workers=8, time_limit=None, random_seed=None,
+               recent_days=None, history=None, rules=()):
+    self.problem = problem
+    self.window = window
+    self.objective = objective
+    self.num_search_workers = num_search_workers
+    # Per window
+    self.time_limit = time_limit
+    self.random_seed = random_seed
+    # How many past days the history keeps, one week by default
+    self.recent_days = recent_days or len(problem.working_days)
+    # rules.py sequence rules added to every window, read from the history
+    # across window boundaries
+    self.rules = list(rules)
+
+    self.num_doctors = len(problem.doctors)
+    if history is None:
+      history = HospitalSchedulingHistory(
+          np.zeros(self.num_doctors, dtype=np.int64),
+          np.full((self.num_doctors, 0), -1, dtype=np.int64))
+    self.history = history
+
+  def solve(self):
+    # Returns the 0/1 values of the full horizon, shaped like the assignment
+    # tensor of HospitalSchedulingSatSolver on the whole problem, or None if
+    # some window has no solution
+    num_weeks = len(self.problem.weeks)
+    result = None
+    previous = None
+    for start in range(num_weeks):
+      stop = min(start + self.window, num_weeks)
+      solver = HospitalSchedulingSatSolver(
+          window_problem(self.problem, start, stop), sparse=True,
+          var_names=False, history=self.history)
+      if self.rules:
+        sequence_rules = SequenceRules(solver)
+        for rule in self.rules:
+          sequence_rules.add(rule)
+      if previous is not None and previous.shape[1] > 1:
+        solver.add_hints(previous[:, 1:], weeks=range(previous.shape[1] - 1))
+      values = solver.solve(mode='optimize', objective=self.objective,
+                            num_search_workers=self.num_search_workers,
+                            time_limit=self.time_limit,
+                            random_seed=self.random_seed)
+      if values is None:
+        print('No roster for the window starting at %s' % self.problem.weeks[start])
+        return None
+      if result is None:
+        shape = list(values.shape)
+        shape[1] = num_weeks
+        result = np.zeros(shape, dtype=np.int8)
+
+      # Freeze the first week of the window and slide forward
+      result[:, start] = values[:, 0]
+      self.history = frozen_history(self.history, values[:, 0], self.recent_days)
+      previous = values
+    return result
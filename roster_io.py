@@ -0,0 +1,273 @@
+"""Roster files for the hospital and school problems.
+
+The problems used to be typed into each script's main(). load_hospital() and
+load_school() read them from a JSON file instead, with the doctors (teachers)
+either inline or in a CSV file next to it, one row each:
+
+  {"areas": ["RMC IR", "SJH Dx/IR"],
+   "weeks": ["Week 1", "Week 2"],
+   "working_days": ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"],
+   "schedules": ["1"], "versions": ["A"],
+   "curriculum": {"1": {"RMC IR": 5, "SJH Dx/IR": 5}},
+   "doctors": "doctors.csv"}
+
+  name,work_days,areas,unavailable
+  Reich,4,RMC IR,Week 1/Monday;Week 2/Friday
+  Simon,5,SJH Dx/IR;RMC IR,
+
+List cells are separated by ';'. A school file has subjects, levels,
+sections, working_days, periods (school_all.py only), curriculum as
+{level: {subject: hours}} and teachers with name, work_hours and subjects.
+
+The input is checked while it's indexed, every problem is collected and
+reported at once in a RosterError.
+
+The solvers index the problems into arrays with problem_arrays.py.
+"""
+
+import csv
+import json
+import os
+
+import numpy as np
+
+import marko
+import school_all
+from marko_weeks import HospitalSchedulingProblem
+
+
+LIST_SEPARATOR = ';'
+
+
+class RosterError(ValueError):
+
+  def __init__(self, errors):
+    ValueError.__init__(self, '%i problem(s) in the roster:\n  %s' % (
+        len(errors), '\n  '.join(errors)))
+    self.errors = errors
+
+
+class RosterReader(object):
+  # Collects the errors of one file while it's read
+
+  def __init__(self, path, data=None):
+    # With `data` (already parsed, e.g. from a request) `path` only names
+    # the source in the messages and CSV files can't be referenced
+    self.path = path
+    self.errors = []
+    self.data = data
+    self.files = data is None
+    if data is None:
+      with open(path) as f:
+        try:
+          self.data = json.load(f)
+        except ValueError as e:
+          raise RosterError(['%s: %s' % (path, e)])
+    if not isinstance(self.data, dict):
+      raise RosterError(['%s: a roster must be a JSON object' % path])
+
+  def error(self, where, message):
+    self.errors.append('%s: %s' % (where, message))
+
+  def names(self, key, default=None):
+    # A list of unique names -> (list, name -> index)
+    value = self.data.get(key, default)
+    if not isinstance(value, list) or not value:
+      self.error(self.path, '"%s" must be a non-empty list' % key)
+      return [], {}
+    names = [str(v) for v in value]
+    index = {}
+    for i, name in enumerate(names):
+      if name in index:
+        self.error(self.path, 'duplicate name %r in "%s"' % (name, key))
+      index.setdefault(name, i)
+    return names, index
+
+  def curriculum(self, rows, columns, row_key, column_key):
+    # {row: {column: count}} -> dense array, every cell required
+    value = self.data.get('curriculum')
+    array = np.zeros((len(rows), len(columns)), dtype=np.int64)
+    if not isinstance(value, dict):
+      self.error(self.path, '"curriculum" must be an object')
+      return array
+    for row, counts in value.items():
+      if row not in rows or not isinstance(counts, dict):
+        self.error(self.path, 'curriculum: unknown %s %r' % (row_key, row))
+        continue
+      for column, count in counts.items():
+        if column not in columns:
+          self.error(self.path, 'curriculum %s: unknown %s %r' % (row, column_key, column))
+        elif integer(count) is None or integer(count) < 0:
+          self.error(self.path, 'curriculum %s, %s: %r is not a count' % (row, column, count))
+        else:
+          array[rows[row], columns[column]] = integer(count)
+      missing = [column for column in columns if column not in counts]
+      if missing:
+        self.error(self.path, 'curriculum %s: %s missing' % (row, abridged(missing)))
+    missing = [row for row in rows if row not in value]
+    if missing:
+      self.error(self.path, 'curriculum: %s missing' % abridged(missing))
+    return array
+
+  def people(self, key):
+    # Inline list of objects, or the name of a CSV file next to the JSON one.
+    # Yields (where, row dict); list cells of a CSV are split on ';'
+    value = self.data.get(key)
+    if isinstance(value, str) and self.files:
+      path = os.path.join(os.path.dirname(self.path), value)
+      with open(path, newline='') as f:
+        for line, row in enumerate(csv.DictReader(f), 2):
+          yield '%s:%i' % (path, line), row
+    elif isinstance(value, list):
+      for i, row in enumerate(value):
+        if isinstance(row, dict):
+          yield '%s: %s[%i]' % (self.path, key, i), row
+        else:
+          self.error(self.path, '%s[%i] must be an object' % (key, i))
+    elif self.files:
+      self.error(self.path, '"%s" must be a list or a CSV file name' % key)
+    else:
+      self.error(self.path, '"%s" must be a list' % key)
+
+  def check(self):
+    if self.errors:
+      raise RosterError(self.errors)
+
+
+def abridged(names, limit=5):
+  if len(names) <= limit:
+    return ', '.join(names)
+  return '%s and %i more' % (', '.join(names[:limit]), len(names) - limit)
+
+
+def cells(value):
+  # A list column: JSON list, or ';' separated CSV cell
+  if isinstance(value, list):
+    return [str(v) for v in value]
+  if value is None:
+    return []
+  return [v.strip() for v in str(value).split(LIST_SEPARATOR) if v.strip()]
+
+
+def integer(value, text=False):
+  # Whole JSON numbers, or with `text` CSV cells, -> int. None for anything
+  # else (booleans, fractions, '4.7')
+  if text:
+    try:
+      return int(value)
+    except (TypeError, ValueError):
+      return None
+  if isinstance(value, bool):
+    return None
+  if isinstance(value, int):
+    return value
+  if isinstance(value, float) and value.is_integer():
+    return int(value)
+  return None
+
+
+def count(reader, where, row, key, text=False):
+  value = integer(row.get(key), text)
+  if value is None:
+    reader.error(where, '%s %r is not a whole number' % (key, row.get(key)))
+    return 0
+  if value < 0:
+    reader.error(where, '%s %r is negative' % (key, value))
+  return value
+
+
+def read_staff(reader, key, limit_key, skill_key, skills):
+  # (names, limits, bool skill matrix (skill, person), where per row)
+  names, limits, rows, places = [], [], [], []
+  # Rows of a CSV file hold strings
+  text = isinstance(reader.data.get(key), str)
+  seen = set()
+  for where, row in reader.people(key):
+    name = str(row.get('name') or '').strip()
+    if not name:
+      reader.error(where, 'name is missing')
+    elif name in seen:
+      reader.error(where, 'duplicate %s %r' % (key[:-1], name))
+    seen.add(name)
+    names.append(name)
+    limits.append(count(reader, where, row, limit_key, text))
+    known = []
+    for skill in cells(row.get(skill_key)):
+      if skill in skills:
+        known.append(skills[skill])
+      else:
+        reader.error(where, 'unknown %s %r' % (skill_key[:-1], skill))
+    rows.append(known)
+    places.append((where, row))
+  matrix = np.zeros((len(skills), len(names)), dtype=bool)
+  for p, known in enumerate(rows):
+    matrix[known, p] = True
+  return names, limits, matrix, places
+
+
+def load_hospital(path, data=None):
+  """Returns the marko_weeks.HospitalSchedulingProblem of a roster file, or
+  of the already parsed `data`."""
+  reader = RosterReader(path, data)
+  areas, area_index = reader.names('areas')
+  weeks, week_index = reader.names('weeks')
+  days, day_index = reader.names('working_days')
+  schedules, schedule_index = reader.names('schedules', ['1'])
+  versions, _ = reader.names('versions', ['A'])
+  curriculum = reader.curriculum(schedule_index, area_index, 'schedule', 'area')
+  doctors, work_days, specialty, places = read_staff(
+      reader, 'doctors', 'work_days', 'areas', area_index)
+
+  unavailable = set()
+  for d, (where, row) in enumerate(places):
+    for cell in cells(row.get('unavailable')):
+      week, _, day = cell.rpartition('/')
+      if week not in week_index or day not in day_index:
+        reader.error(where, 'unavailable %r is not a week/day' % cell)
+      else:
+        unavailable.add((d, week_index[week], day_index[day]))
+  idle = [areas[a] for a in np.nonzero(~specialty.any(axis=1))[0]]
+  if idle:
+    reader.error(path, 'no doctor works in %s' % abridged(idle))
+  reader.check()
+
+  return HospitalSchedulingProblem(
+      areas, doctors,
+      dict(((schedule, area), int(curriculum[i, a]))
+           for i, schedule in enumerate(schedules) for a, area in enumerate(areas)),
+      [np.nonzero(row)[0].tolist() for row in specialty], weeks, days,
+      schedules, versions, work_days, unavailable)
+
+
+def load_school(path, data=None):
+  """Returns the SchoolSchedulingProblem of a roster file, or of `data`.
+
+  With "periods" the problem is a school_all.py one, a marko.py one without.
+  """
+  reader = RosterReader(path, data)
+  subjects, subject_index = reader.names('subjects')
+  levels, level_index = reader.names('levels')
+  sections, _ = reader.names('sections')
+  days, _ = reader.names('working_days')
+  periods = None
+  if 'periods' in reader.data:
+    periods, _ = reader.names('periods')
+  curriculum = reader.curriculum(level_index, subject_index, 'level', 'subject')
+  teachers, work_hours, specialty, _ = read_staff(
+      reader, 'teachers', 'work_hours', 'subjects', subject_index)
+  idle = [subjects[s] for s in np.nonzero(~specialty.any(axis=1))[0]]
+  if idle:
+    reader.error(path, 'no teacher teaches %s' % abridged(idle))
+  reader.check()
+
+  curriculum = dict(((level, subject), int(curriculum[l, s]))
+                    for l, level in enumerate(levels)
+                    for s, subject in enumerate(subjects))
+  specialties = [np.nonzero(row)[0].tolist() for row in specialty]
+  if periods is None:
+    return marko.SchoolSchedulingProblem(
+        subjects, teachers, curriculum, specialties, days, levels, sections,
+        work_hours)
+  return school_all.SchoolSchedulingProblem(
+      subjects, teachers, curriculum, specialties, days, periods, levels,
+      sections, work_hours)
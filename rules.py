@@ -0,0 +1,212 @@
+"""Sequence rules over the days of each doctor, compiled to CP-SAT automata.
+
+Rules such as "at most N consecutive days in the same area" written as
+constraints over windows of assignment[sv, w, a, d, day] take one constraint
+per window and area, for every doctor. Here every doctor instead gets one
+integer variable per day of the horizon, weeks laid end to end:
+
+  0      day off
+  a + 1  working in area a
+
+channeled to the assignment tensor with one linear equality (a doctor works
+at most one area per day), and each rule is a deterministic automaton read
+over that sequence with AddAutomaton, so the model grows linearly with the
+horizon.
+
+A rule describes its automaton with start(position), the state before a day
+at `position` within the week, and step(state, label), the state after
+reading a day or None when the day is forbidden. SequenceRules explores the
+states reachable from the initial one over the labels the doctor can take,
+numbers them and adds the transitions. With a HospitalSchedulingHistory the
+initial state is the one reached after reading history.recent_areas, so a
+stint or a full week at the end of the previous window carries over.
+
+  solver = HospitalSchedulingSatSolver(problem, sparse=True, history=history)
+  rules = SequenceRules(solver)
+  rules.add(MaxConsecutive(3))
+  rules.add(MinStint(2, 'RMC IR'))
+  rules.add(RestAfterFullWeek())
+  values = solver.solve(mode='optimize')
+
+The rules couple consecutive weeks, don't combine them with
+solver.break_symmetries().
+"""
+
+import collections
+
+from ortools.sat.python import cp_model
+
+
+OFF = 0
+
+
+def area_index(problem, area):
+  # Area name or index -> index
+  if isinstance(area, str):
+    return problem.areas.index(area)
+  return area
+
+
+class MaxConsecutive(object):
+  # At most `days` consecutive days in the same area, for every area or only
+  # the given ones
+
+  def __init__(self, days, areas=None):
+    self.days = days
+    self.areas = areas
+    self.labels = None
+
+  def bind(self, problem):
+    if self.areas is None:
+      self.labels = None
+    else:
+      self.labels = set(area_index(problem, a) + 1 for a in self.areas)
+
+  def start(self, position):
+    return (OFF, 0)
+
+  def step(self, state, label):
+    last, run = state
+    if label == OFF or (self.labels is not None and label not in self.labels):
+      return (OFF, 0)
+    run = run + 1 if label == last else 1
+    if run > self.days:
+      return None
+    return (label, run)
+
+
+class MinStint(object):
+  # A doctor who starts in `area` stays there at least `days` consecutive
+  # days. A stint cut short by the end of the horizon is allowed, it goes on
+  # in the next window.
+
+  def __init__(self, days, area):
+    self.days = days
+    self.area = area
+    self.label = None
+
+  def bind(self, problem):
+    self.label = area_index(problem, self.area) + 1
+
+  def start(self, position):
+    return 0
+
+  def step(self, run, label):
+    if label != self.label:
+      return None if 0 < run < self.days else 0
+    return min(run + 1, self.days)
+
+
+class RestAfterFullWeek(object):
+  # A doctor who worked every working day of a week is off the first `days`
+  # days of the next one
+
+  def __init__(self, days=1):
+    self.days = days
+    self.week_length = None
+
+  def bind(self, problem):
+    self.week_length = len(problem.working_days)
+
+  def start(self, position):
+    # (position of the next day, worked every day of the week so far, rest
+    # days still owed). A week joined halfway can't be a full one.
+    return (position, position == 0, 0)
+
+  def step(self, state, label):
+    position, full, owed = state
+    if owed and label != OFF:
+      return None
+    owed = max(owed - 1, 0)
+    full = full and label != OFF
+    position += 1
+    if position == self.week_length:
+      if full:
+        owed = self.days
+      position, full = 0, True
+    return (position, full, owed)
+
+
+def compile_automaton(rule, initial, labels):
+  # Numbers the states reachable from `initial` over `labels`, returns
+  # (transitions as (state, label, next state), number of states)
+  numbers = {initial: 0}
+  queue = collections.deque([initial])
+  transitions = []
+  while queue:
+    state = queue.popleft()
+    for label in labels:
+      following = rule.step(state, label)
+      if following is None:
+        continue
+      if following not in numbers:
+        numbers[following] = len(numbers)
+        queue.append(following)
+      transitions.append((numbers[state], label, numbers[following]))
+  return transitions, len(numbers)
+
+
+class SequenceRules(object):
+
+  def __init__(self, solver, history=None):
+    self.solver = solver
+    self.problem = solver.problem
+    self.history = solver.history if history is None else history
+    self.model = solver.model
+    self.num_weeks = len(self.problem.weeks)
+    self.num_days = len(self.problem.working_days)
+    # doctor -> one label variable per day of the horizon, built on first use
+    self.daily = {}
+
+  def labels(self, doctor):
+    # Day off plus the areas the doctor is eligible for
+    return [OFF] + [a + 1 for a in range(len(self.problem.areas))
+                    if self.solver.eligible[a, doctor]]
+
+  def daily_areas(self, doctor):
+    """Label variables of `doctor`, one per day of the horizon, week-major."""
+    if doctor in self.daily:
+      return self.daily[doctor]
+    assignment = self.solver.assignment
+    domain = cp_model.Domain.FromValues(self.labels(doctor))
+    days = []
+    for w in range(self.num_weeks):
+      for day in range(self.num_days):
+        var = self.model.NewIntVarFromDomain(domain, '')
+        cells = assignment.vars[:, w, :, doctor, day]
+        mask = assignment.mask[:, w, :, doctor, day]
+        _, areas = mask.nonzero()
+        self.model.Add(var == cp_model.LinearExpr.WeightedSum(
+            list(cells[mask]), [int(a) + 1 for a in areas]))
+        days.append(var)
+    self.daily[doctor] = days
+    return days
+
+  def initial_state(self, rule, doctor):
+    # State after reading the doctor's recent days, which end right before
+    # the first day of the horizon
+    recent = []
+    if self.history is not None:
+      recent = [int(a) + 1 if a >= 0 else OFF for a in self.history.recent_areas[doctor]]
+    position = -len(recent) % self.num_days
+    state = rule.start(position)
+    for label in recent:
+      position = (position + 1) % self.num_days
+      state = rule.step(state, label)
+      if state is None:
+        # The past broke the rule, start over from the next day
+        state = rule.start(position)
+    return state
+
+  def add(self, rule, doctors=None):
+    """Adds `rule` for every doctor, or the given doctor indices."""
+    rule.bind(self.problem)
+    if doctors is None:
+      doctors = range(len(self.problem.doctors))
+    with self.solver.telemetry.phase('sequence rules'):
+      for doctor in doctors:
+        labels = self.labels(doctor)
+        transitions, num_states = compile_automaton(
+            rule, self.initial_state(rule, doctor), labels)
+        self.model.AddAutomaton(self.daily_areas(doctor), 0,
+                                list(range(num_states)), transitions)
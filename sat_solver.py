@@ -0,0 +1,198 @@
+"""Search and reporting shared by the CP-SAT solvers.
+
+SatSolver runs the two kinds of search every solver offers and prints their
+statistics: enumerate() walks every solution with SearchForAllSolutions,
+search() runs one parallel Solve() on an objective. A subclass builds
+self.model, self.assignment (a VarTensor), self.live (the cells of the tensor
+holding a decision) and self.telemetry, names its objectives in objectives()
+and prints a few enumerated solutions with the callback returned by
+solution_printer().
+
+TeacherObjectives holds the objectives of the school solvers (marko.py,
+school_all.py and school_2.py), which only differ in the axes of their
+assignment tensor.
+"""
+
+from ortools.sat.python import cp_model
+
+from solution_sinks import SinkCallback
+
+
+# Solutions printed by the enumeration when no sink is given
+A_FEW_SOLUTIONS = [1, 2, 100, 1000, 5000, 50000, 100000, 2000000]
+
+# Axis -> prefix in the variable names
+AXIS_LABELS = {
+    'course': 'C',
+    'schedule_version': 'C',
+    'week': 'W',
+    'subject': 'S',
+    'area': 'S',
+    'teacher': 'T',
+    'doctor': 'T',
+    'slot': 'Slot',
+    'day': 'Slot',
+}
+
+
+def print_statistics(solver, status=None):
+  print('- Statistics')
+  if status is not None:
+    print('  - Status', solver.StatusName(status))
+  print('  - Branches', solver.NumBranches())
+  print('  - Conflicts', solver.NumConflicts())
+  print('  - WallTime', solver.WallTime())
+
+
+class SatSolver(object):
+
+  def key_name(self, key):
+    # e.g. 'C:{0} S:{2} T:{1} Slot:{3}'
+    return ' '.join('%s:{%i}' % (AXIS_LABELS[axis], i)
+                    for axis, i in zip(self.assignment.axes, key))
+
+  def enumerate(self, sink=None, time_limit=None):
+    """Walks every solution and returns their number.
+
+    The solutions go to `sink` (see solution_sinks), or a few of them are
+    printed. A search stopped by `time_limit` returns the solutions found so
+    far, self.complete is False then.
+    """
+    print('Solving')
+    solver = cp_model.CpSolver()
+    if time_limit is not None:
+      solver.parameters.max_time_in_seconds = time_limit
+    if sink is None:
+      callback = self.solution_printer()
+    else:
+      sink.open(self.assignment)
+      callback = SinkCallback(self.assignment, sink)
+    try:
+      with self.telemetry.solving(solver):
+        self.status = solver.SearchForAllSolutions(self.model, callback)
+    finally:
+      # Also when the search raised (e.g. KeyboardInterrupt), so the writer
+      # thread is joined and its file flushed
+      if sink is not None:
+        sink.close()
+    # OPTIMAL once every solution was seen, INFEASIBLE when there is none
+    self.complete = self.status in (cp_model.OPTIMAL, cp_model.INFEASIBLE)
+    print_statistics(solver)
+    print('  - solutions found : %i' % callback.SolutionCount())
+    if not self.complete:
+      print('  - stopped before the end of the search, the count is partial')
+    return callback.SolutionCount()
+
+  def minimize(self, objective):
+    # The name of one of objectives() or a callable(solver) returning the
+    # expression to minimize
+    with self.telemetry.phase('objective'):
+      if callable(objective):
+        self.model.Minimize(objective(self))
+      elif objective is not None:
+        self.model.Minimize(self.objectives()[objective]())
+
+  def search(self, objective=None, num_search_workers=8, time_limit=None,
+             random_seed=None):
+    # One Solve() on `objective`, returns the CpSolver; the status is kept in
+    # self.status
+    print('Solving')
+    self.minimize(objective)
+    solver = cp_model.CpSolver()
+    solver.parameters.num_search_workers = num_search_workers
+    if time_limit is not None:
+      solver.parameters.max_time_in_seconds = time_limit
+    if random_seed is not None:
+      solver.parameters.random_seed = random_seed
+    with self.telemetry.solving(solver):
+      self.status = solver.Solve(self.model, self.telemetry.callback())
+    print_statistics(solver, self.status)
+    if objective is not None and self.found():
+      print('  - Objective', solver.ObjectiveValue())
+    return solver
+
+  def found(self):
+    return self.status in (cp_model.OPTIMAL, cp_model.FEASIBLE)
+
+  def optimize(self, objective=None, num_search_workers=8, time_limit=None,
+               random_seed=None):
+    # Returns the 0/1 values of the assignment tensor for the best solution
+    # found, or None when the search ends without one
+    solver = self.search(objective, num_search_workers, time_limit, random_seed)
+    if not self.found():
+      return None
+    return self.assignment.values_from(solver.ResponseProto().solution)
+
+  def hamming_distance(self, values):
+    # Number of cells that differ from a 0/1 array shaped like the assignment
+    # tensor, cells without a decision count as 0
+    previous = values[self.live]
+    cells = self.assignment.vars[self.live]
+    was_off = [var for var, v in zip(cells, previous.tolist()) if not v]
+    was_on = [var for var, v in zip(cells, previous.tolist()) if v]
+    return (len(was_on) + cp_model.LinearExpr.Sum(was_off) -
+            cp_model.LinearExpr.Sum(was_on))
+
+  def print_status(self):
+    print(self.telemetry.summary())
+
+
+class TeacherObjectives(object):
+
+  def var_name(self, key):
+    # Names are only needed when debugging the model, building a string per
+    # variable is a noticeable part of the build time on large rosters
+    if not self.var_names:
+      return ''
+    axes = self.assignment.axes
+    s, t = key[axes.index('subject')], key[axes.index('teacher')]
+    prefix = '' if self.eligible[s, t] else 'NO DISP '
+    return prefix + self.key_name(key)
+
+  def solve(self, mode='enumerate', objective=None, num_search_workers=8,
+            time_limit=None, random_seed=None, sink=None):
+    # mode='enumerate' walks every solution and prints a few of them, or
+    # hands them to `sink` (see solution_sinks) and returns the count,
+    # mode='optimize' runs a parallel search and returns one timetable
+    if mode == 'optimize':
+      return self.optimize(objective, num_search_workers, time_limit, random_seed)
+    return self.enumerate(sink, time_limit)
+
+  def objectives(self):
+    return {
+        'balance_hours': self.balance_hours_objective,
+        'min_max_usage': self.max_usage_objective,
+    }
+
+  def teacher_loads(self):
+    # teacher -> number of timeslots taught, one expression per teacher
+    over = [axis for axis in self.assignment.axes if axis != 'teacher']
+    return [expr for _, expr in self.assignment.sums(over=over)]
+
+  def balance_hours_objective(self):
+    # Spread between the busiest and the least busy teacher, teachers without
+    # any specialty can't take classes and are left out
+    loads = self.teacher_loads()
+    hours = self.arrays.work_hours.tolist()
+    totals = []
+    for t in range(self.num_teachers):
+      if not self.eligible[:, t].any():
+        continue
+      total = self.model.NewIntVar(0, hours[t], '')
+      self.model.Add(total == loads[t])
+      totals.append(total)
+    busiest = self.model.NewIntVar(0, max(hours), 'busiest')
+    idlest = self.model.NewIntVar(0, max(hours), 'idlest')
+    self.model.AddMaxEquality(busiest, totals)
+    self.model.AddMinEquality(idlest, totals)
+    return busiest - idlest
+
+  def max_usage_objective(self):
+    # Number of teachers that teach all of their teacher_work_hours
+    hours = self.arrays.work_hours.tolist()
+    at_max = []
+    for t, load in enumerate(self.teacher_loads()):
+      full = self.model.NewBoolVar('')
+      self.model.Add(load <= hours[t] - 1 + full)
+      at_max.append(full)
+    return cp_model.LinearExpr.Sum(at_max)
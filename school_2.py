@@ -8,8 +8,14 @@ So we have some restrictions:
 - For a given course and subject, the teacher must be the same for all of them (ex: 1°A has only one Math teacher)
 I modeled the problem as a big boolean matrix: assign[c, s, t, ts] = 1 if teacher t is assigned to course c and subject s in timeslot ts, and I've been able to add all the constraints but the last one."""
 
+import numpy as np
 from ortools.sat.python import cp_model
 
+from problem_arrays import SchoolArrays
+from sat_solver import A_FEW_SOLUTIONS, SatSolver, TeacherObjectives
+from telemetry import Telemetry
+from var_tensor import VarTensor
+
 
 class SchoolSchedulingProblem(object):
 
@@ -24,11 +30,16 @@ class SchoolSchedulingProblem(object):
     self.teacher_work_hours = teacher_work_hours
 
 
-class SchoolSchedulingSatSolver(object):
+class SchoolSchedulingSatSolver(TeacherObjectives, SatSolver):
 
-  def __init__(self, problem):
+  def __init__(self, problem, sparse=False, var_names=True, telemetry=None):
     # Problem
     self.problem = problem
+    self.sparse = sparse
+    self.var_names = var_names
+    # Phase timers and search progress, see print_status()
+    self.telemetry = Telemetry() if telemetry is None else telemetry
+    telemetry = self.telemetry
 
     # Utilities
     self.timeslots = [
@@ -47,19 +58,41 @@ class SchoolSchedulingSatSolver(object):
     all_slots = range(self.num_slots)
     all_subjects = range(self.num_subjects)
 
-    self.model = cp_model.CpModel()
+    # Eligibility index: subject -> teachers that get a variable, teacher ->
+    # subjects. In sparse mode only the (subject, teacher) pairs listed in the
+    # specialties exist, in dense mode every pair does and the ineligible ones
+    # are fixed to 0
+    self.arrays = SchoolArrays(problem)
+    # (subject, teacher) -> eligible
+    self.eligible = self.arrays.specialty
+    if sparse:
+      self.subject_teachers = [np.nonzero(self.eligible[s])[0].tolist()
+                               for s in all_subjects]
+    else:
+      self.subject_teachers = [list(all_teachers) for s in all_subjects]
+    self.teacher_subjects = [[] for t in all_teachers]
+    for s in all_subjects:
+      for t in self.subject_teachers[s]:
+        self.teacher_subjects[t].append(s)
 
-    self.assignment = {}
+    self.model = cp_model.CpModel()
 
-    for s in all_subjects:
-      for t in all_teachers:
-        for slot in all_slots:
-          if t in self.problem.specialties[s]:
-            name = 'S:{%i} T:{%i} Slot:{%i}' % (s, t, slot)
-            self.assignment[s, t, slot] = self.model.NewBoolVar(name)
-          else:
-            name = 'NO DISP  S:{%i} T:{%i} Slot:{%i}' % (s, t, slot)
-            self.assignment[s, t, slot] = self.model.NewIntVar(0, 0, name)
+    self.assignment = VarTensor(
+        ('subject', 'teacher', 'slot'),
+        (self.num_subjects, self.num_teachers, self.num_slots))
+
+    # Cells holding a decision, as opposed to the fixed zeros of the dense layout
+    self.live = np.zeros(self.assignment.shape, dtype=bool)
+    with telemetry.phase('variables'):
+      for s in all_subjects:
+        for t in self.subject_teachers[s]:
+          for slot in all_slots:
+            key = (s, t, slot)
+            if self.eligible[s, t]:
+              self.assignment[key] = self.model.NewBoolVar(self.var_name(key))
+              self.live[key] = True
+            else:
+              self.assignment[key] = self.model.NewIntVar(0, 0, self.var_name(key))
 
     # Constraints
 
@@ -76,15 +109,14 @@ class SchoolSchedulingSatSolver(object):
     #               for teacher in all_teachers) == required_slots)
 
     # Teacher can do at most one class at a time
-    for teacher in all_teachers:
-      for slot in all_slots:
-        self.model.Add(
-            sum([self.assignment[s, teacher, slot] for s in all_subjects]) <= 1)
+    with telemetry.phase('one class per slot'):
+      for (teacher, slot), expr in self.assignment.sums(over=('subject',)):
+        self.model.Add(expr <= 1)
 
     # Maximum work hours for each teacher
-    for teacher in all_teachers:
-      self.model.Add(
-          sum([self.assignment[s, teacher, slot] for s in all_subjects for slot in all_slots]) <= self.problem.teacher_work_hours[teacher])
+    with telemetry.phase('max work hours'):
+      for (teacher,), expr in self.assignment.sums(over=('subject', 'slot')):
+        self.model.Add(expr <= int(self.arrays.work_hours[teacher]))
 
     # # Teacher makes all the classes of a subject's course
     # teacher_courses = {}
@@ -103,30 +135,27 @@ class SchoolSchedulingSatSolver(object):
     #           sum(teacher_courses[course, subject, t]
     #               for t in all_teachers) == 1)
 
+    self.telemetry.record_model(self.model)
+
     # Solution collector
     self.collector = None
+    self.status = None
 
-  def solve(self):
-    print('Solving')
-    a_few_solutions = [1, 2, 100, 1000, 5000, 50000, 100000, 2000000]
+  def solution_printer(self):
+    return SchoolSchedulingSatSolutionPrinter(self.assignment, self.problem.working_days, self.problem.periods, self.timeslots,
+      self.problem.teachers, self.problem.subjects, A_FEW_SOLUTIONS)
 
-    solver = cp_model.CpSolver()
-    solution_printer = SchoolSchedulingSatSolutionPrinter(self.assignment, self.problem.working_days, self.problem.periods, self.timeslots,
-      self.problem.teachers, self.problem.subjects, a_few_solutions)
-    status = solver.SearchForAllSolutions(self.model, solution_printer)
-    print('- Statistics')
-    print('  - Branches', solver.NumBranches())
-    print('  - Conflicts', solver.NumConflicts())
-    print('  - WallTime', solver.WallTime())
-    print('  - solutions found : %i' % solution_printer.SolutionCount())
-
-  def print_status(self):
-    pass
+  def print_solution(self, values):
+    for s, t, slot in zip(*values.nonzero()):
+      print(' Subject #%s | Teacher #%s | TimeSlot #%s' % (
+          self.problem.subjects[s], self.problem.teachers[t],
+          self.timeslots[slot]))
 
 
 class SchoolSchedulingSatSolutionPrinter(cp_model.CpSolverSolutionCallback):
 
   def __init__(self, assignment, working_days, periods, timeslots, teachers, subjects, sols):
+    cp_model.CpSolverSolutionCallback.__init__(self)
 
     self.__working_days = working_days
     self.__periods = periods
@@ -149,16 +178,18 @@ class SchoolSchedulingSatSolutionPrinter(cp_model.CpSolverSolutionCallback):
       print('\n')
       print('Solution #%i' % self.__solution_count)
       
-      for s in range(self.__num_subjects):
-        for t in range(self.__num_teachers):
-          for ts in range(self.__num_slots):
-            if self.Value(self.__assignment[(s, t, ts)]):
-              subject_name = self.__subjects[s]
-              teacher_name = self.__teachers[t]
-              slot_name = self.__slots[ts]
-              print(' Subject #%s | Teacher #%s | TimeSlot #%s' % (subject_name, teacher_name, slot_name))
+      # Read the whole solution in one call and walk the cells set to 1, in
+      # sparse mode the ineligible pairs have no cell at all
+      values = self.__assignment.values_from(self.Response().solution)
+      for s, t, ts in zip(*values.nonzero()):
+        subject_name = self.__subjects[s]
+        teacher_name = self.__teachers[t]
+        slot_name = self.__slots[ts]
+        print(' Subject #%s | Teacher #%s | TimeSlot #%s' % (subject_name, teacher_name, slot_name))
       print('\n')
 
+  on_solution_callback = NewSolution
+
   def SolutionCount(self):
     return self.__solution_count
 
@@ -191,7 +222,7 @@ def main():
   problem = SchoolSchedulingProblem(
       subjects, teachers, curriculum, specialties_idx_inverse, working_days,
       periods, teachers_work_hours)
-  solver = SchoolSchedulingSatSolver(problem)
+  solver = SchoolSchedulingSatSolver(problem, sparse=True)
   solver.solve()
   solver.print_status()
 
@@ -0,0 +1,245 @@
+"""Per-course decomposition of the school_all.py model.
+
+Courses (level x section) are only coupled through the teachers: a teacher
+gives one class per slot and at most teacher_work_hours classes. The
+monolithic model still grows with the number of courses, which hurts for
+districts with hundreds of sections.
+
+SchoolDecompositionSolver splits the courses in groups (one per level, or one
+per course), each an ordinary school_all problem with the group's levels and
+sections, and solves the groups in parallel. A master coordinates the shared
+teacher capacity by handing out disjoint shares. It first gives every
+(course, subject) of the pending groups to one eligible teacher, greedily by
+hours left, which tells how much of each teacher a group needs; each group
+then gets those hours (scaled down when a teacher is overbooked) and, in the
+same proportion, its own subset of the teacher's free slots. Any
+combination of group timetables is then conflict free. Groups that solve are
+fixed; the capacity they leave unused is pooled and shared again between the
+groups that failed, for up to max_rounds rounds (with a single group left that
+is plain sequential fixing). Groups still failing after that are repaired in
+the full model, together with the courses holding the teachers they are
+short of, every other course fixed. If that fails too the full model is
+solved without fixing anything, hinted with the partial timetable.
+
+  values = SchoolDecompositionSolver(problem, group_by='level').solve()
+
+The result has the layout of SchoolSchedulingSatSolver(problem).assignment.
+"""
+
+import concurrent.futures
+
+import numpy as np
+from ortools.sat.python import cp_model
+
+from school_all import SchoolSchedulingProblem
+from school_all import SchoolSchedulingSatSolver
+
+
+class SchoolDecompositionSolver(object):
+
+  def __init__(self, problem, group_by='level', max_rounds=10, num_threads=None,
+               num_search_workers=1, time_limit=None):
+    self.problem = problem
+    self.num_levels = len(problem.levels)
+    self.num_sections = len(problem.sections)
+    self.num_courses = self.num_levels * self.num_sections
+    self.num_subjects = len(problem.subjects)
+    self.num_teachers = len(problem.teachers)
+    self.num_slots = len(problem.working_days) * len(problem.periods)
+    self.shape = (self.num_courses, self.num_subjects, self.num_teachers,
+                  self.num_slots)
+    self.max_rounds = max_rounds
+    self.num_threads = num_threads
+    # Per subproblem, the repair and fallback get all the cores
+    self.num_search_workers = num_search_workers
+    self.time_limit = time_limit
+
+    # Groups of (level, section) index pairs
+    if group_by == 'level':
+      self.groups = [[(l, s) for s in range(self.num_sections)]
+                     for l in range(self.num_levels)]
+    elif group_by == 'course':
+      self.groups = [[(l, s)] for l in range(self.num_levels)
+                     for s in range(self.num_sections)]
+    else:
+      raise ValueError('group_by must be "level" or "course", not %r' % group_by)
+
+    # Filled by solve()
+    self.rounds = 0
+    # Groups left to solve at the start of each round
+    self.pending = []
+    self.repaired_courses = []
+    self.fell_back = False
+    self.status = None
+
+  def courses(self, g):
+    return [level * self.num_sections + section for level, section in self.groups[g]]
+
+  def need(self, pending, hours_left):
+    # Hours each pending group is expected to take from each teacher. A
+    # course gets one teacher per subject, so every (course, subject) is
+    # given whole to the eligible teacher with the most hours left, largest
+    # and least flexible first
+    need = np.zeros((len(self.groups), self.num_teachers), dtype=np.int64)
+    left = np.array(hours_left, dtype=np.int64)
+    items = []
+    for g in pending:
+      for level, section in self.groups[g]:
+        for s, subject in enumerate(self.problem.subjects):
+          hours = self.problem.curriculum[self.problem.levels[level], subject]
+          teachers = sorted(set(self.problem.specialties[s]))
+          items.append((-hours, len(teachers), g, teachers))
+    for hours, _, g, teachers in sorted(items):
+      t = max(teachers, key=lambda t: left[t])
+      need[g, t] -= hours
+      left[t] += hours
+    return need
+
+  def shares(self, pending, free, hours_left):
+    """Splits the remaining capacity between the pending groups.
+
+    Returns {group: (hours per teacher, bool slots per teacher)}.
+    """
+    need = self.need(pending, hours_left)
+    hours = dict((g, [0] * self.num_teachers) for g in pending)
+    slots = dict((g, np.zeros((self.num_teachers, self.num_slots), dtype=bool))
+                 for g in pending)
+    for t in range(self.num_teachers):
+      groups = [g for g in pending if need[g, t] > 0]
+      if not groups:
+        continue
+      weights = np.array([need[g, t] for g in groups], dtype=float)
+      if weights.sum() <= hours_left[t]:
+        split = [int(need[g, t]) for g in groups]
+      else:
+        split = largest_remainder(int(hours_left[t]), weights / weights.sum())
+      for g, h in zip(groups, split):
+        hours[g][t] = h
+      weights /= weights.sum()
+      # Deal the free slots one at a time to the group furthest below its
+      # share, which also spreads each group's slots over the week
+      free_slots = np.nonzero(free[t])[0]
+      given = np.zeros(len(groups))
+      for i, slot in enumerate(free_slots):
+        k = int(np.argmax(weights * (i + 1) - given))
+        given[k] += 1
+        slots[groups[k]][t, slot] = True
+    return dict((g, (hours[g], slots[g])) for g in pending)
+
+  def solve_group(self, g, hours, slots):
+    group = self.groups[g]
+    level = group[0][0]
+    problem = SchoolSchedulingProblem(
+        self.problem.subjects, self.problem.teachers, self.problem.curriculum,
+        self.problem.specialties, self.problem.working_days,
+        self.problem.periods, [self.problem.levels[level]],
+        [self.problem.sections[s] for _, s in group], hours)
+    solver = SchoolSchedulingSatSolver(problem, sparse=True, var_names=False)
+    tensor = solver.assignment
+    # Slots of the other groups are closed
+    closed = tensor.mask & ~slots[np.newaxis, np.newaxis]
+    for var in tensor.vars[closed]:
+      solver.model.Add(var == 0)
+
+    sat = cp_model.CpSolver()
+    sat.parameters.num_search_workers = self.num_search_workers
+    if self.time_limit is not None:
+      sat.parameters.max_time_in_seconds = self.time_limit
+    status = sat.Solve(solver.model)
+    if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+      return None
+    return tensor.values_from(sat.ResponseProto().solution)
+
+  def solve(self):
+    """Returns the 0/1 timetable or None when there is none."""
+    values = np.zeros(self.shape, dtype=np.int8)
+    free = np.ones((self.num_teachers, self.num_slots), dtype=bool)
+    hours_left = np.array(self.problem.teacher_work_hours, dtype=np.int64)
+    pending = list(range(len(self.groups)))
+
+    while pending and self.rounds < self.max_rounds:
+      self.rounds += 1
+      self.pending.append(len(pending))
+      shares = self.shares(pending, free, hours_left)
+      # CP-SAT releases the GIL while it searches, threads are enough
+      with concurrent.futures.ThreadPoolExecutor(self.num_threads) as pool:
+        results = list(pool.map(lambda g: self.solve_group(g, *shares[g]), pending))
+      failed = []
+      for g, result in zip(pending, results):
+        if result is None:
+          failed.append(g)
+          continue
+        values[self.courses(g)] = result
+        used = result.sum(axis=(0, 1))
+        free &= used == 0
+        hours_left -= used.sum(axis=1)
+      if len(failed) == len(pending):
+        break
+      pending = failed
+
+    if not pending:
+      self.status = cp_model.FEASIBLE
+      return values
+    failing = [c for g in pending for c in self.courses(g)]
+    return self.repair(values, failing, hours_left, free)
+
+  def repair(self, values, failing, hours_left, free):
+    # The failing courses are solved again together with the courses that
+    # hold the teachers they are short of. A subject is short when its
+    # pending hours exceed what its teachers have left, or when no single
+    # teacher has the hours and free slots left for one of the courses (a
+    # course keeps one teacher per subject); the courses taught a short
+    # subject by one of its teachers are released
+    capacity = np.minimum(hours_left, free.sum(axis=1))
+    demand = np.zeros(self.num_subjects, dtype=np.int64)
+    short = set()
+    for c in failing:
+      level = self.problem.levels[c // self.num_sections]
+      for s, subject in enumerate(self.problem.subjects):
+        hours = self.problem.curriculum[level, subject]
+        demand[s] += hours
+        if capacity[sorted(set(self.problem.specialties[s]))].max() < hours:
+          short.add(s)
+    released = set(failing)
+    for s in range(self.num_subjects):
+      teachers = sorted(set(self.problem.specialties[s]))
+      if s in short or demand[s] > capacity[teachers].sum():
+        released.update(int(c) for c in np.nonzero(values[:, s, teachers].any(axis=(1, 2)))[0])
+    self.repaired_courses = sorted(released)
+    fixed = set(range(self.num_courses)) - released
+    result = self.solve_full(values, fixed)
+    if result is None and fixed:
+      self.fell_back = True
+      result = self.solve_full(values, set())
+    return result
+
+  def solve_full(self, values, fixed):
+    # Full model with the `fixed` courses pinned to `values`, the others
+    # hinted with them
+    solver = SchoolSchedulingSatSolver(self.problem, sparse=True, var_names=False)
+    tensor = solver.assignment
+    for c in range(self.num_courses):
+      cells = tensor.mask[c]
+      for var, value in zip(tensor.vars[c][cells], values[c][cells]):
+        if c in fixed:
+          solver.model.Add(var == int(value))
+        else:
+          solver.model.AddHint(var, int(value))
+
+    sat = cp_model.CpSolver()
+    sat.parameters.num_search_workers = max(8, self.num_search_workers)
+    if self.time_limit is not None:
+      sat.parameters.max_time_in_seconds = self.time_limit
+    self.status = sat.Solve(solver.model)
+    if self.status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+      return None
+    return tensor.values_from(sat.ResponseProto().solution)
+
+
+def largest_remainder(total, weights):
+  # Splits the integer `total` in proportion to `weights` (summing to 1)
+  exact = total * weights
+  parts = np.floor(exact).astype(np.int64)
+  for i in np.argsort(parts - exact)[:total - int(parts.sum())]:
+    parts[i] += 1
+  return [int(p) for p in parts]
@@ -0,0 +1,471 @@
+"""Asyncio job service around the solvers, with a local HTTP front end.
+
+SolverService queues optimization jobs (any problem batch.py knows) on a
+process pool of max_jobs workers. submit() returns a job id right away;
+events() streams the job's progress as it runs: phase timings, objective and
+bound updates, every improving roster (its cells set to 1) and last a
+'result' event. cancel() drops a queued job, or stops a running search by
+calling StopSearch on its solution callback; the best roster found so far is
+kept.
+
+  async with SolverService(max_jobs=2) as service:
+    job = service.submit(problem, objective='balance_workdays', time_limit=60)
+    async for event in service.events(job):
+      print(event)
+
+serve() puts the service behind a small HTTP/1.1 server, on a TCP port or a
+Unix socket, written with asyncio streams only:
+
+  POST   /jobs              {"problem": {roster, see roster_io.py},
+                             "objective": ..., "time_limit": ...} -> {"id": ...}
+  GET    /jobs              status of every job
+  GET    /jobs/<id>         status, and the roster once done
+  GET    /jobs/<id>/events  events as JSON lines until the job ends
+  DELETE /jobs/<id>         cancel
+
+  python service.py --port 8080
+  curl -N localhost:8080/jobs/1/events
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import contextlib
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+
+from batch import solver_class
+from batch import workers_per_job
+from roster_io import RosterError
+from roster_io import load_hospital
+from roster_io import load_school
+from telemetry import ProgressCallback
+from telemetry import Telemetry
+
+
+# Seconds a finished job waits for its last events to come through
+END_TIMEOUT = 5.0
+
+
+class JobTelemetry(Telemetry):
+  # Runs in the worker: events go to the service's queue, the solution
+  # callback also sends the rosters and can be stopped from the watcher
+
+  def __init__(self, job_id, queue, stream_solutions):
+    Telemetry.__init__(self, listener=self.send, interval=0.5)
+    self.job_id = job_id
+    self.queue = queue
+    self.stream_solutions = stream_solutions
+    self.assignment = None
+    self.running = None
+
+  def send(self, event):
+    self.queue.put((self.job_id, event))
+
+  def callback(self):
+    self.running = StreamingCallback(self)
+    return self.running
+
+
+class StreamingCallback(ProgressCallback):
+
+  def __init__(self, telemetry):
+    ProgressCallback.__init__(self, telemetry)
+    self.__telemetry = telemetry
+
+  def on_solution_callback(self):
+    ProgressCallback.on_solution_callback(self)
+    telemetry = self.__telemetry
+    if telemetry.stream_solutions and telemetry.assignment is not None:
+      values = telemetry.assignment.values_from(self.Response().solution)
+      telemetry.send({'event': 'roster', 'objective': self.ObjectiveValue(),
+                      'cells': cells_of(values)})
+
+  NewSolution = on_solution_callback
+
+
+def cells_of(values):
+  # Index tuples of the cells set to 1, JSON-able
+  return [[int(i) for i in cell] for cell in zip(*values.nonzero())]
+
+
+def run_job(job_id, problem, options, queue, cancel, num_search_workers):
+  # Runs in a worker process
+  telemetry = JobTelemetry(job_id, queue, options.get('stream_solutions', True))
+  telemetry.send({'event': 'start', 'pid': os.getpid()})
+  result = {'status': None, 'cells': None}
+  try:
+    with contextlib.redirect_stdout(io.StringIO()):
+      solver_options = dict({'sparse': True, 'var_names': False},
+                            **options.get('solver_options', {}))
+      solver = solver_class(problem)(problem, telemetry=telemetry, **solver_options)
+      telemetry.assignment = solver.assignment
+      if cancel.is_set():
+        result['status'] = 'CANCELLED'
+        return result
+
+      # Watches the cancel flag while the search runs
+      done = threading.Event()
+
+      def watch():
+        while not done.is_set() and not cancel.wait(0.1):
+          pass
+        # Cancelled: stop the search once, as soon as its callback exists
+        while not done.is_set():
+          if telemetry.running is not None:
+            telemetry.running.StopSearch()
+            return
+          done.wait(0.1)
+
+      watcher = threading.Thread(target=watch, daemon=True)
+      watcher.start()
+      try:
+        values = solver.solve(mode='optimize', objective=options.get('objective'),
+                              num_search_workers=num_search_workers,
+                              time_limit=options.get('time_limit'),
+                              random_seed=options.get('random_seed'))
+      finally:
+        done.set()
+        watcher.join()
+    result['status'] = telemetry.search.get('status')
+    if cancel.is_set():
+      result['status'] = 'CANCELLED'
+    if values is not None:
+      result['cells'] = cells_of(values)
+    result['telemetry'] = telemetry.report()
+    return result
+  finally:
+    telemetry.send({'event': 'end'})
+
+
+class Job(object):
+
+  def __init__(self, job_id, name, problem, options):
+    self.id = job_id
+    self.name = name
+    self.problem = problem
+    self.options = options
+    # queued, running, then done, cancelled or failed
+    self.status = 'queued'
+    self.events = []
+    self.result = None
+    self.error = None
+    self.submitted = time.time()
+    self.started = None
+    self.finished = None
+    self.future = None
+    self.cancel_flag = None
+    self.changed = asyncio.Condition()
+    self.ended = asyncio.Event()
+
+  def done(self):
+    return self.finished is not None
+
+  def summary(self, cells=False):
+    summary = {
+        'id': self.id,
+        'name': self.name,
+        'status': self.status,
+        'submitted': self.submitted,
+        'started': self.started,
+        'finished': self.finished,
+        'events': len(self.events),
+    }
+    if self.result is not None:
+      summary['search_status'] = self.result.get('status')
+      if cells:
+        summary['cells'] = self.result.get('cells')
+    if self.error is not None:
+      summary['error'] = self.error
+    return summary
+
+
+class SolverService(object):
+
+  def __init__(self, max_jobs=None, num_search_workers=None):
+    self.max_jobs, workers = workers_per_job(max_jobs or os.cpu_count() or 1, max_jobs)
+    self.num_search_workers = num_search_workers or workers
+    self.jobs = {}
+    self.__ids = itertools.count(1)
+    self.__context = multiprocessing.get_context('spawn')
+    self.__manager = None
+    self.__queue = None
+    self.__pool = None
+    self.__reader = None
+    self.__waiting = []
+
+  async def __aenter__(self):
+    await self.start()
+    return self
+
+  async def __aexit__(self, *exc):
+    await self.close()
+
+  async def start(self):
+    # The manager's queue and events can be handed to pool workers, plain
+    # multiprocessing ones can't
+    self.__manager = self.__context.Manager()
+    self.__queue = self.__manager.Queue()
+    self.__pool = concurrent.futures.ProcessPoolExecutor(
+        self.max_jobs, mp_context=self.__context)
+    self.__reader = asyncio.get_running_loop().create_task(self.read_events())
+
+  async def close(self):
+    for job in self.jobs.values():
+      if not job.done():
+        self.cancel(job.id)
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, self.__pool.shutdown)
+    await asyncio.gather(*self.__waiting)
+    self.__queue.put(None)
+    await self.__reader
+    self.__manager.shutdown()
+
+  def submit(self, problem, objective=None, time_limit=None, random_seed=None,
+             solver_options=None, stream_solutions=True, name=None):
+    """Queues an optimization of `problem`, returns the job id."""
+    job_id = '%i' % next(self.__ids)
+    options = {
+        'objective': objective,
+        'time_limit': time_limit,
+        'random_seed': random_seed,
+        'solver_options': dict(solver_options or {}),
+        'stream_solutions': stream_solutions,
+    }
+    job = Job(job_id, name or 'job %s' % job_id, problem, options)
+    job.cancel_flag = self.__manager.Event()
+    job.future = self.__pool.submit(run_job, job_id, problem, options, self.__queue,
+                                    job.cancel_flag, self.num_search_workers)
+    self.jobs[job_id] = job
+    self.__waiting.append(asyncio.get_running_loop().create_task(self.wait_for(job)))
+    return job_id
+
+  async def wait_for(self, job):
+    try:
+      job.result = await asyncio.wrap_future(job.future)
+    except asyncio.CancelledError:
+      # Dropped from the queue, anything else cancelling us goes on
+      if not job.future.cancelled():
+        raise
+      job.status = 'cancelled'
+    except Exception as e:  # reported in the job
+      job.status = 'failed'
+      job.error = '%s: %s' % (type(e).__name__, e)
+    else:
+      # The worker's last events may still be in the queue
+      with contextlib.suppress(asyncio.TimeoutError):
+        await asyncio.wait_for(job.ended.wait(), END_TIMEOUT)
+      job.status = 'cancelled' if job.result['status'] == 'CANCELLED' else 'done'
+    job.finished = time.time()
+    await self.publish(job, dict(job.summary(cells=True), event='result'))
+
+  async def read_events(self):
+    loop = asyncio.get_running_loop()
+    while True:
+      item = await loop.run_in_executor(None, self.__queue.get)
+      if item is None:
+        return
+      job_id, event = item
+      job = self.jobs.get(job_id)
+      if job is None:
+        continue
+      if event['event'] == 'start':
+        job.status = 'running'
+        job.started = time.time()
+      if event['event'] == 'end':
+        job.ended.set()
+        continue
+      await self.publish(job, event)
+
+  async def publish(self, job, event):
+    async with job.changed:
+      job.events.append(event)
+      job.changed.notify_all()
+
+  def cancel(self, job_id):
+    """Cancels a queued job, or stops a running search. False if unknown."""
+    job = self.jobs.get(job_id)
+    if job is None:
+      return False
+    if not job.future.cancel():
+      job.cancel_flag.set()
+    return True
+
+  async def events(self, job_id, start=0):
+    """Yields the events of a job from `start` until it's finished."""
+    job = self.jobs[job_id]
+    index = start
+    while True:
+      async with job.changed:
+        await job.changed.wait_for(lambda: len(job.events) > index)
+        batch = job.events[index:]
+      index += len(batch)
+      for event in batch:
+        yield event
+        if event['event'] == 'result':
+          return
+
+  async def wait(self, job_id):
+    async for _ in self.events(job_id):
+      pass
+    return self.jobs[job_id]
+
+
+def parse_problem(data):
+  # Roster JSON (see roster_io.py) -> problem, hospital when it has areas
+  if not isinstance(data, dict):
+    raise RosterError(['request: "problem" must be an object'])
+  if 'areas' in data:
+    return load_hospital('request', data)
+  return load_school('request', data)
+
+
+class HttpError(Exception):
+
+  def __init__(self, status, message):
+    Exception.__init__(self, message)
+    self.status = status
+
+
+REASONS = {200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found',
+           405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+async def handle(service, reader, writer):
+  # One request per connection
+  try:
+    try:
+      method, path, body = await read_request(reader)
+      await route(service, writer, method, path, body)
+    except HttpError as e:
+      await respond(writer, e.status, {'error': str(e)})
+    except RosterError as e:
+      await respond(writer, 400, {'error': 'invalid roster', 'problems': e.errors})
+    except (ConnectionError, asyncio.IncompleteReadError):
+      raise
+    except Exception:
+      # A bug, not the client's fault: answer instead of dropping the
+      # connection, the traceback goes to the service's log
+      traceback.print_exc()
+      await respond(writer, 500, {'error': 'internal error'})
+  except (ConnectionError, asyncio.IncompleteReadError):
+    pass
+  finally:
+    writer.close()
+
+
+async def read_request(reader):
+  line = (await reader.readline()).decode('latin-1').split()
+  if len(line) != 3:
+    raise HttpError(400, 'malformed request line')
+  headers = {}
+  while True:
+    header = (await reader.readline()).decode('latin-1').strip()
+    if not header:
+      break
+    key, _, value = header.partition(':')
+    headers[key.strip().lower()] = value.strip()
+  body = None
+  try:
+    length = int(headers.get('content-length') or 0)
+  except ValueError:
+    raise HttpError(400, 'bad Content-Length')
+  if length < 0:
+    raise HttpError(400, 'bad Content-Length')
+  if length:
+    try:
+      body = json.loads(await reader.readexactly(length))
+    except ValueError:
+      raise HttpError(400, 'the body must be JSON')
+  return line[0].upper(), line[1].split('?')[0].rstrip('/'), body
+
+
+async def route(service, writer, method, path, body):
+  parts = path.strip('/').split('/')
+  if parts[0] != 'jobs' or len(parts) > 3:
+    raise HttpError(404, 'no route for %s' % path)
+  if len(parts) == 1:
+    if method == 'GET':
+      await respond(writer, 200, [job.summary() for job in service.jobs.values()])
+    elif method == 'POST':
+      body = body or {}
+      if not isinstance(body, dict):
+        raise HttpError(400, 'the body must be a JSON object')
+      problem = parse_problem(body.get('problem'))
+      job_id = service.submit(
+          problem, objective=body.get('objective'), time_limit=body.get('time_limit'),
+          random_seed=body.get('random_seed'),
+          stream_solutions=body.get('stream_solutions', True), name=body.get('name'))
+      await respond(writer, 201, {'id': job_id})
+    else:
+      raise HttpError(405, '%s not allowed on /jobs' % method)
+    return
+
+  job_id = parts[1]
+  if job_id not in service.jobs:
+    raise HttpError(404, 'no job %s' % job_id)
+  if len(parts) == 3 and parts[2] == 'events' and method == 'GET':
+    # Streamed as JSON lines, the connection closes after the 'result' event
+    writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n'
+                 b'Connection: close\r\n\r\n')
+    async for event in service.events(job_id):
+      writer.write(json.dumps(event).encode() + b'\n')
+      await writer.drain()
+  elif len(parts) == 2 and method == 'GET':
+    await respond(writer, 200, service.jobs[job_id].summary(cells=True))
+  elif len(parts) == 2 and method == 'DELETE':
+    service.cancel(job_id)
+    await respond(writer, 200, service.jobs[job_id].summary())
+  else:
+    raise HttpError(405, '%s not allowed on %s' % (method, path))
+
+
+async def respond(writer, status, payload):
+  body = json.dumps(payload).encode()
+  writer.write(('HTTP/1.1 %i %s\r\nContent-Type: application/json\r\n'
+                'Content-Length: %i\r\nConnection: close\r\n\r\n' % (
+                    status, REASONS[status], len(body))).encode() + body)
+  await writer.drain()
+
+
+async def serve(service, host='127.0.0.1', port=8080, path=None):
+  """Starts the HTTP front end, on the Unix socket `path` when given."""
+  handler = lambda reader, writer: handle(service, reader, writer)
+  if path is not None:
+    return await asyncio.start_unix_server(handler, path)
+  return await asyncio.start_server(handler, host, port)
+
+
+async def run_server(args):
+  async with SolverService(args.max_jobs, args.num_search_workers) as service:
+    server = await serve(service, args.host, args.port, args.unix)
+    where = args.unix or '%s:%i' % (args.host, args.port)
+    print('Serving on %s' % where)
+    async with server:
+      await server.serve_forever()
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--host', default='127.0.0.1')
+  parser.add_argument('--port', type=int, default=8080)
+  parser.add_argument('--unix', help='Unix socket path, instead of TCP')
+  parser.add_argument('--max-jobs', type=int, default=None,
+                      help='jobs solved at once (default: one per core)')
+  parser.add_argument('--num-search-workers', type=int, default=None,
+                      help='CP-SAT workers per job (default: cores / max jobs)')
+  args = parser.parse_args()
+  try:
+    asyncio.run(run_server(args))
+  except KeyboardInterrupt:
+    pass
+
+
+if __name__ == '__main__':
+  main()
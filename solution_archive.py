@@ -0,0 +1,255 @@
+"""Columnar on-disk archive of hospital rosters, read through numpy.memmap.
+
+ArchiveWriter is a solution_sinks writer: give it to any sink and every
+solution the sink keeps is stored as one int16 doctor id per
+(schedule_version, week, area, day), -1 when no doctor is set, instead of the
+whole 0/1 tensor.
+
+Records are grouped in blocks of block_size solutions and each block is
+stored cell-major: for every cell, the doctor of each solution of the block
+next to each other. Blocks have a fixed size (the last one is padded), so
+the file is a flat array of identical structs that numpy.memmap maps
+directly, and reading one cell across all solutions touches block_size
+contiguous values per block instead of one value per record.
+
+With delta=True every solution but the first of a block holds the
+difference to the previous one, zero wherever the two agree (consecutive
+solutions of an enumeration differ in a few cells); decoding a cell is a
+cumulative sum along the block. The stride stays the same either way.
+
+File: ARCHIVE_MAGIC, uint32 header size, JSON header padded with spaces
+(rewritten with the record count on close), then the blocks:
+int64 solution numbers [block_size], int16 ids [cells, block_size].
+
+  sink = EveryNthSink(1000, ArchiveWriter('rosters.arc', labels=labels_of(problem)))
+  solver.solve(sink=sink)
+
+  archive = SolutionArchive('rosters.arc')
+  archive.covering(area=3, day=1)      # doctor of that cell in every solution
+  archive.doctor_loads()                # (solutions, doctors) days worked
+"""
+
+import json
+import struct
+
+import numpy as np
+
+from solution_sinks import BackgroundWriter
+
+
+ARCHIVE_MAGIC = b'SCHDARC1'
+# Header space reserved up front, grown for long labels
+HEADER_BYTES = 4096
+NO_DOCTOR = -1
+
+
+def labels_of(problem):
+  # Axis name -> names, stored in the header for name lookups
+  return {
+      'week': list(problem.weeks),
+      'area': list(problem.areas),
+      'doctor': list(problem.doctors),
+      'day': list(problem.working_days),
+  }
+
+
+class ArchiveWriter(BackgroundWriter):
+
+  def __init__(self, path, block_size=1024, delta=False, labels=None,
+               id_axis='doctor'):
+    BackgroundWriter.__init__(self, path)
+    self.block_size = block_size
+    self.delta = delta
+    self.labels = labels or {}
+    self.id_axis = id_axis
+    self.header = None
+    self.header_bytes = None
+    self.records = 0
+    self.numbers = None
+    self.block = None
+    self.filled = 0
+    self.previous = None
+
+  def write_header(self, tensor):
+    axis = tensor.axes.index(self.id_axis)
+    if tensor.shape[axis] > np.iinfo(np.int16).max:
+      raise ValueError('%i %ss don\'t fit int16 ids' % (tensor.shape[axis], self.id_axis))
+    axes = [a for a in tensor.axes if a != self.id_axis]
+    shape = [n for a, n in zip(tensor.axes, tensor.shape) if a != self.id_axis]
+    self.header = {
+        'axes': axes,
+        'shape': shape,
+        'id_axis': self.id_axis,
+        'num_ids': tensor.shape[axis],
+        'source_axes': list(tensor.axes),
+        'block_size': self.block_size,
+        'delta': self.delta,
+        'labels': self.labels,
+        'records': 0,
+    }
+    encoded = json.dumps(self.header).encode()
+    self.header_bytes = HEADER_BYTES
+    while len(encoded) + 64 > self.header_bytes:
+      self.header_bytes *= 2
+    self.axis = axis
+    self.num_cells = int(np.prod(shape, dtype=np.int64))
+    self.numbers = np.zeros(self.block_size, dtype='<i8')
+    self.block = np.zeros((self.num_cells, self.block_size), dtype='<i2')
+    self.put_header()
+
+  def put_header(self):
+    encoded = json.dumps(self.header).encode()
+    self.file.write(ARCHIVE_MAGIC)
+    self.file.write(struct.pack('<I', self.header_bytes))
+    self.file.write(encoded.ljust(self.header_bytes, b' '))
+
+  def write_record(self, count, cells):
+    values = np.zeros(self.shape, dtype=np.int8)
+    values[self.mask] = cells
+    if (values.sum(axis=self.axis) > 1).any():
+      raise ValueError('solution %i has cells with more than one %s' % (
+          count, self.id_axis))
+    ids = np.where(values.any(axis=self.axis), values.argmax(axis=self.axis),
+                   NO_DOCTOR).astype('<i2').ravel()
+    column = ids
+    if self.delta and self.filled:
+      column = ids - self.previous
+    self.previous = ids
+    self.numbers[self.filled] = count
+    self.block[:, self.filled] = column
+    self.filled += 1
+    self.records += 1
+    if self.filled == self.block_size:
+      self.flush_block()
+
+  def flush_block(self):
+    if not self.filled:
+      return
+    self.numbers[self.filled:] = 0
+    self.block[:, self.filled:] = 0
+    self.file.write(self.numbers.tobytes())
+    self.file.write(self.block.tobytes())
+    self.filled = 0
+
+  def close(self):
+    # The last block and the record count go in after the writer thread is
+    # done
+    if self.thread is not None:
+      self.queue.put(None)
+      self.thread.join()
+      self.thread = None
+    if self.file is not None and self.error is None:
+      self.flush_block()
+      self.header['records'] = self.records
+      self.file.seek(0)
+      self.put_header()
+    BackgroundWriter.close(self)
+
+
+class SolutionArchive(object):
+
+  def __init__(self, path):
+    self.path = path
+    with open(path, 'rb') as f:
+      if f.read(len(ARCHIVE_MAGIC)) != ARCHIVE_MAGIC:
+        raise ValueError('%s is not a solution archive' % path)
+      header_bytes, = struct.unpack('<I', f.read(4))
+      self.header = json.loads(f.read(header_bytes))
+    self.axes = self.header['axes']
+    self.shape = tuple(self.header['shape'])
+    self.num_ids = self.header['num_ids']
+    self.block_size = self.header['block_size']
+    self.delta = self.header['delta']
+    self.labels = self.header['labels']
+    self.num_records = self.header['records']
+    num_cells = int(np.prod(self.shape, dtype=np.int64))
+    self.dtype = np.dtype([('numbers', '<i8', (self.block_size,)),
+                           ('ids', '<i2', (num_cells, self.block_size))])
+    num_blocks = -(-self.num_records // self.block_size)
+    if num_blocks:
+      self.blocks = np.memmap(path, dtype=self.dtype, mode='r',
+                              offset=len(ARCHIVE_MAGIC) + 4 + header_bytes,
+                              shape=(num_blocks,))
+    else:
+      # mmap can't map an empty range
+      self.blocks = np.zeros(0, dtype=self.dtype)
+
+  def __len__(self):
+    return self.num_records
+
+  def index(self, axis, key):
+    # Position on `axis` of an index or a label
+    if isinstance(key, str):
+      return self.labels[axis].index(key)
+    return key
+
+  def cell(self, **coords):
+    # Flat cell of e.g. area=3, day=1; axes left out must have size 1
+    position = []
+    for axis, size in zip(self.axes, self.shape):
+      if axis not in coords and size != 1:
+        raise TypeError('%s is required' % axis)
+      position.append(self.index(axis, coords.get(axis, 0)))
+    return int(np.ravel_multi_index(position, self.shape))
+
+  def decode(self, ids):
+    # (..., block_size) stored ids of whole blocks -> doctor ids
+    if self.delta:
+      ids = np.cumsum(ids, axis=-1, dtype=np.int64)
+    return ids.astype(np.int16)
+
+  def solution_numbers(self):
+    return self.blocks['numbers'].reshape(-1)[:self.num_records].copy()
+
+  def covering(self, **coords):
+    """Doctor id of one cell in every stored solution, -1 when none.
+
+    e.g. covering(area='RMC IR', day='Monday', week=0, schedule_version=0)
+    """
+    cell = self.cell(**coords)
+    return self.decode(self.blocks['ids'][:, cell, :]).reshape(-1)[:self.num_records]
+
+  def coverage(self, **coords):
+    """How many stored solutions put each doctor on one cell."""
+    ids = self.covering(**coords)
+    return np.bincount(ids[ids >= 0], minlength=self.num_ids)
+
+  def iter_blocks(self):
+    # (first record, decoded ids (cells, records)) one block at a time
+    for b in range(len(self.blocks)):
+      count = min(self.block_size, self.num_records - b * self.block_size)
+      yield b * self.block_size, self.decode(self.blocks[b]['ids'])[:, :count]
+
+  def doctor_loads(self, week=None):
+    """(solutions, doctors) cells each doctor covers, in one week or all."""
+    loads = np.zeros((self.num_records, self.num_ids), dtype=np.int32)
+    cells = np.arange(int(np.prod(self.shape)))
+    if week is not None:
+      weeks = np.unravel_index(cells, self.shape)[self.axes.index('week')]
+      cells = cells[weeks == self.index('week', week)]
+    for first, ids in self.iter_blocks():
+      ids = ids[cells]
+      records = np.broadcast_to(np.arange(ids.shape[1]), ids.shape)
+      covered = ids >= 0
+      np.add.at(loads, (first + records[covered], ids[covered]), 1)
+    return loads
+
+  def solution(self, i):
+    """Doctor ids of record i, shaped like the archive axes."""
+    block, column = divmod(i, self.block_size)
+    ids = self.blocks[block]['ids']
+    if self.delta:
+      ids = ids[:, :column + 1].sum(axis=1, dtype=np.int64)
+    else:
+      ids = ids[:, column]
+    return ids.astype(np.int16).reshape(self.shape)
+
+  def values(self, i):
+    """0/1 assignment tensor of record i, axes as in the solver."""
+    ids = self.solution(i)
+    source_axes = self.header['source_axes']
+    axis = source_axes.index(self.header['id_axis'])
+    one_hot = np.zeros(self.shape + (self.num_ids,), dtype=np.int8)
+    covered = ids >= 0
+    one_hot[covered, ids[covered]] = 1
+    return np.moveaxis(one_hot, -1, axis)
@@ -0,0 +1,248 @@
+"""Counts the solutions of the marko.py / marko_weeks.py models without
+enumerating them.
+
+SearchForAllSolutions() visits every solution through a Python callback, which
+takes hours on real rosters. The count factors instead:
+
+Hospital (marko_weeks.py). Weeks share no constraint, so the count is the
+product of the week counts. Within a week the schedule versions and the
+doctors are picked independently: each (area, day) gets exactly one schedule
+version, whichever doctor covers it, so the versions contribute
+num_days! / prod(curriculum!) per area. What remains is which doctor covers
+each (area, day): one area per doctor and day, doctor_work_days per week.
+Areas and doctors split in components of the specialty graph, which are
+counted apart and multiplied. Each component is a dynamic program over the
+days, the state being the days each doctor has left. A doctor with at least
+as many days left as there are days to go can't be limited any more, so the
+state only keeps min(days left, days to go), which merges most states. The
+per-day moves are the doctor sets that can cover the component's areas that
+day, with their number of matchings, computed once per day.
+
+School (marko.py). Slots are interchangeable, so a teacher giving n_s classes
+of each (course, subject) s has C(S, n_1) C(S - n_1, n_2) ... ways to place
+them in the S slots. The program walks the (course, subject) pairs of each
+component of the specialty graph, splits their classes among the eligible
+teachers and keeps the hours given by each teacher as the state.
+
+When a component has more than max_states states the exact program is
+dropped for a certified upper bound: the count of the same component without
+the work day (hour) limits, and for the school also without the one class per
+slot rule. The report says which components are exact.
+
+  report = count_solutions(problem)
+  print(report.count, report.exact)
+"""
+
+import collections
+import math
+import time
+
+
+class CountTooLarge(Exception):
+  pass
+
+
+class CountReport(object):
+
+  def __init__(self):
+    # Exact number of solutions, or an upper bound when exact is False
+    self.count = 1
+    self.exact = True
+    # (name, count, exact) per independent factor
+    self.factors = []
+    self.seconds = 0.0
+
+  def add(self, name, count, exact=True):
+    self.factors.append((name, count, exact))
+    self.count *= count
+    self.exact = self.exact and exact
+
+  def __int__(self):
+    return self.count
+
+  def __str__(self):
+    if self.exact:
+      lines = ['%i solutions' % self.count]
+    else:
+      lines = ['At most %i solutions (upper bound)' % self.count]
+    for name, count, exact in self.factors:
+      lines.append('  - %-40s %i%s' % (name, count, '' if exact else ' (bound)'))
+    return '\n'.join(lines)
+
+
+def count_solutions(problem, max_states=10**6):
+  """Returns a CountReport for a marko_weeks.py or marko.py problem."""
+  start = time.perf_counter()
+  if hasattr(problem, 'weeks'):
+    report = count_hospital(problem, max_states)
+  elif hasattr(problem, 'periods'):
+    raise ValueError('only the marko.py school model can be counted, %s has '
+                     'periods' % type(problem).__name__)
+  else:
+    report = count_school(problem, max_states)
+  report.seconds = time.perf_counter() - start
+  return report
+
+
+def components(num_left, edges):
+  # Connected components of a bipartite graph given as left -> right nodes,
+  # as (left nodes, right nodes) pairs. Right nodes without an edge are left
+  # out, they can't take part in any solution
+  parent = {}
+
+  def find(x):
+    while parent.setdefault(x, x) != x:
+      parent[x] = parent[parent[x]]
+      x = parent[x]
+    return x
+
+  for left in range(num_left):
+    find(('l', left))
+    for right in edges[left]:
+      parent[find(('l', left))] = find(('r', right))
+  groups = collections.OrderedDict()
+  for left in range(num_left):
+    groups.setdefault(find(('l', left)), ([], set()))[0].append(left)
+    groups[find(('l', left))][1].update(edges[left])
+  return [(lefts, sorted(rights)) for lefts, rights in groups.values()]
+
+
+def count_hospital(problem, max_states):
+  report = CountReport()
+  num_days = len(problem.working_days)
+  num_versions = len(problem.versions)
+
+  # Schedule versions of each area, the same every week
+  versions = 1
+  for area in problem.areas:
+    required = [problem.curriculum[schedule, area]
+                for schedule in problem.schedules for v in range(num_versions)]
+    if sum(required) != num_days:
+      versions = 0
+      break
+    versions *= math.factorial(num_days)
+    for days in required:
+      versions //= math.factorial(days)
+  if num_versions * len(problem.schedules) > 1 or versions == 0:
+    report.add('schedule versions', versions ** len(problem.weeks))
+  if versions == 0:
+    return report
+
+  specialties = [sorted(set(problem.specialties[a])) for a in range(len(problem.areas))]
+  for areas, doctors in components(len(problem.areas), specialties):
+    # Weeks with the same unavailability in the component count the same
+    counts = {}
+    for w, week in enumerate(problem.weeks):
+      busy = frozenset((d, day) for d in doctors for day in range(num_days)
+                       if (d, w, day) in problem.doctor_unavailable)
+      if busy not in counts:
+        counts[busy] = count_doctor_component(problem, areas, doctors, busy, max_states)
+      count, exact = counts[busy]
+      name = '%s (%s)' % (', '.join(problem.areas[a] for a in areas), week)
+      report.add(name, count, exact)
+  return report
+
+
+def count_doctor_component(problem, areas, doctors, busy, max_states):
+  """Returns (count, exact) for the doctor choices of one component in a week."""
+  num_days = len(problem.working_days)
+  index = dict((d, i) for i, d in enumerate(doctors))
+  days = [day_matchings(problem, areas, index, busy, day) for day in range(num_days)]
+
+  # days left per doctor, capped at the days to go
+  start = tuple(min(problem.doctor_work_days[d], num_days) for d in doctors)
+  states = {start: 1}
+  try:
+    for day, matchings in enumerate(days):
+      to_go = num_days - day - 1
+      following = collections.defaultdict(int)
+      for state, ways in states.items():
+        for used, count in matchings.items():
+          left = list(state)
+          for i in used:
+            if not left[i]:
+              break
+            left[i] -= 1
+          else:
+            following[tuple(min(x, to_go) for x in left)] += ways * count
+      if len(following) > max_states:
+        raise CountTooLarge()
+      states = following
+  except CountTooLarge:
+    bound = 1
+    for matchings in days:
+      bound *= sum(matchings.values())
+    return bound, False
+  return sum(states.values()), True
+
+
+def day_matchings(problem, areas, index, busy, day):
+  # {doctors used (tuple of component indices): number of ways} for covering
+  # every area of the component with a different available doctor
+  partial = {0: 1}
+  for a in areas:
+    following = collections.defaultdict(int)
+    for used, ways in partial.items():
+      for d in set(problem.specialties[a]):
+        bit = 1 << index[d]
+        if not used & bit and (d, day) not in busy:
+          following[used | bit] += ways
+    partial = following
+  return dict((tuple(i for i in range(len(index)) if used >> i & 1), ways)
+              for used, ways in partial.items())
+
+
+def count_school(problem, max_states):
+  report = CountReport()
+  num_slots = len(problem.working_days)
+  courses = [(level, section) for level in problem.levels
+             for section in problem.sections]
+  specialties = [sorted(set(problem.specialties[s])) for s in range(len(problem.subjects))]
+
+  for subjects, teachers in components(len(problem.subjects), specialties):
+    items = [(courses[c], s) for c in range(len(courses)) for s in subjects]
+    name = ', '.join(problem.subjects[s] for s in subjects)
+    try:
+      count = count_teacher_component(problem, items, teachers, num_slots, max_states)
+      report.add(name, count)
+    except CountTooLarge:
+      # Every (course, subject) picks its cells among its teachers' slots
+      bound = 1
+      for (level, section), s in items:
+        required = problem.curriculum[level, problem.subjects[s]]
+        bound *= math.comb(len(specialties[s]) * num_slots, required)
+      report.add(name, bound, False)
+  return report
+
+
+def count_teacher_component(problem, items, teachers, num_slots, max_states):
+  index = dict((t, i) for i, t in enumerate(teachers))
+  capacity = [min(problem.teacher_work_hours[t], num_slots) for t in teachers]
+  # hours given per teacher
+  states = {tuple(0 for t in teachers): 1}
+  for (level, section), s in items:
+    required = problem.curriculum[level, problem.subjects[s]]
+    eligible = [index[t] for t in sorted(set(problem.specialties[s]))]
+    following = collections.defaultdict(int)
+    for state, ways in states.items():
+      for given, count in splits(state, eligible, required, capacity, num_slots):
+        following[given] += ways * count
+    if len(following) > max_states:
+      raise CountTooLarge()
+    states = following
+  return sum(states.values())
+
+
+def splits(state, eligible, required, capacity, num_slots):
+  # Yields (state after, ways) for every split of `required` classes among
+  # the eligible teachers, each placed in free slots of its teacher
+  if not eligible:
+    if not required:
+      yield state, 1
+    return
+  i = eligible[0]
+  for n in range(min(required, capacity[i] - state[i]) + 1):
+    ways = math.comb(num_slots - state[i], n)
+    given = state[:i] + (state[i] + n,) + state[i + 1:]
+    for after, count in splits(given, eligible[1:], required - n, capacity, num_slots):
+      yield after, ways * count
@@ -0,0 +1,296 @@
+"""Streaming solution sinks for SearchForAllSolutions.
+
+The solution printers ran the whole dense loop nest and called Value() once
+per variable for every sampled solution, then printed to stdout from the
+solver thread. Here the callback only counts solutions and asks a sink whether
+it wants the current one. When it does, the values of the candidate variables
+(the cells of the assignment tensor) are read in one batch into a NumPy array
+and handed to a writer, which encodes and writes them from a background thread.
+
+Sinks decide which solutions to keep:
+  CountOnlySink     keeps none, only the count
+  PickSink          keeps the given solution numbers (the old a_few_solutions)
+  MultiplicitySink  sees every solution and adds up a weight per solution,
+                    e.g. the number of symmetric copies it stands for
+  EveryNthSink      keeps every nth solution
+  ReservoirSink     keeps a uniform random sample of k solutions
+
+Writers decide where they go:
+  NdjsonWriter      one JSON object per line with the index of every cell at 1
+  BinaryWriter      fixed-size records of bit-packed cell values
+"""
+
+import abc
+import json
+import queue
+import random
+import struct
+import threading
+
+import numpy as np
+
+from ortools.sat.python import cp_model
+
+
+BINARY_MAGIC = b'SCHDSOL1'
+
+
+class SinkCallback(cp_model.CpSolverSolutionCallback):
+
+  def __init__(self, tensor, sink):
+    cp_model.CpSolverSolutionCallback.__init__(self)
+    self.__sink = sink
+    self.__cells = tensor.proto_indices()[tensor.mask]
+    self.__solution_count = 0
+
+  def on_solution_callback(self):
+    self.__solution_count += 1
+    if self.__sink.wants(self.__solution_count):
+      # One call to fetch the whole solution, then a vectorized gather of the
+      # candidate variables
+      solution = np.fromiter(self.Response().solution, dtype=np.int64)
+      self.__sink.add(self.__solution_count,
+                      solution[self.__cells].astype(np.int8))
+
+  NewSolution = on_solution_callback
+
+  def SolutionCount(self):
+    return self.__solution_count
+
+
+class SolutionSink(object):
+
+  def __init__(self, writer=None):
+    self.writer = writer
+
+  def open(self, tensor):
+    # Called by the solver before the search with the assignment tensor
+    if self.writer is not None:
+      self.writer.open(tensor)
+
+  def wants(self, count):
+    return False
+
+  def add(self, count, cells):
+    self.writer.write(count, cells)
+
+  def close(self):
+    if self.writer is not None:
+      self.writer.close()
+
+
+class CountOnlySink(SolutionSink):
+
+  def __init__(self):
+    SolutionSink.__init__(self, None)
+
+
+class PickSink(SolutionSink):
+
+  def __init__(self, solution_numbers, writer):
+    SolutionSink.__init__(self, writer)
+    self.solution_numbers = set(solution_numbers)
+
+  def wants(self, count):
+    return count in self.solution_numbers
+
+
+class EveryNthSink(SolutionSink):
+
+  def __init__(self, n, writer):
+    SolutionSink.__init__(self, writer)
+    self.n = n
+
+  def wants(self, count):
+    return count % self.n == 0
+
+
+class ReservoirSink(SolutionSink):
+  # Algorithm R: after the search the reservoir holds a uniform sample of k
+  # solutions, it is written out sorted by solution number on close()
+
+  def __init__(self, k, writer, seed=None):
+    SolutionSink.__init__(self, writer)
+    self.k = k
+    self.reservoir = []
+    self.random = random.Random(seed)
+    self.slot = None
+
+  def wants(self, count):
+    if count <= self.k:
+      self.slot = count - 1
+      return True
+    j = self.random.randrange(count)
+    if j < self.k:
+      self.slot = j
+      return True
+    return False
+
+  def add(self, count, cells):
+    if self.slot == len(self.reservoir):
+      self.reservoir.append((count, cells))
+    else:
+      self.reservoir[self.slot] = (count, cells)
+
+  def close(self):
+    for count, cells in sorted(self.reservoir, key=lambda item: item[0]):
+      self.writer.write(count, cells)
+    SolutionSink.close(self)
+
+
+class MultiplicitySink(SolutionSink):
+  # With symmetry breaking each solution found stands for weight(values)
+  # solutions of the original model. Every solution is read to add up the
+  # total, the wrapped sink still gets only the ones it wants
+
+  def __init__(self, weight, sink=None):
+    SolutionSink.__init__(self, None)
+    self.weight = weight
+    self.sink = sink
+    self.total = 0
+    self.forward = False
+    self.shape = None
+    self.mask = None
+
+  def open(self, tensor):
+    self.shape = tensor.shape
+    self.mask = tensor.mask
+    if self.sink is not None:
+      self.sink.open(tensor)
+
+  def wants(self, count):
+    self.forward = self.sink is not None and self.sink.wants(count)
+    return True
+
+  def add(self, count, cells):
+    values = np.zeros(self.shape, dtype=np.int8)
+    values[self.mask] = cells
+    self.total += self.weight(values)
+    if self.forward:
+      self.sink.add(count, cells)
+
+  def close(self):
+    if self.sink is not None:
+      self.sink.close()
+
+
+class BackgroundWriter(abc.ABC):
+  # Encoding and file I/O happen on a writer thread, write() only enqueues so
+  # the solver thread doesn't wait on each write. At most max_pending
+  # solutions wait in the queue: when the disk falls behind, write() blocks
+  # the solver until the writer catches up instead of holding every solution
+  # in memory
+
+  def __init__(self, path, buffer_size=1 << 20, max_pending=1024):
+    self.path = path
+    self.buffer_size = buffer_size
+    self.queue = queue.Queue(maxsize=max_pending)
+    self.thread = None
+    self.error = None
+    self.file = None
+    self.shape = None
+    self.mask = None
+
+  def open(self, tensor):
+    self.shape = tensor.shape
+    self.mask = tensor.mask.copy()
+    self.file = open(self.path, 'wb', buffering=self.buffer_size)
+    self.write_header(tensor)
+    self.thread = threading.Thread(target=self.run, name='solution-writer',
+                                   daemon=True)
+    self.thread.start()
+
+  def write(self, count, cells):
+    self.queue.put((count, cells))
+
+  def run(self):
+    # After an error the queue is still drained so write() never blocks on a
+    # dead writer
+    while True:
+      item = self.queue.get()
+      if item is None:
+        break
+      if self.error is None:
+        try:
+          self.write_record(*item)
+        except Exception as e:  # reported from close()
+          self.error = e
+
+  def close(self):
+    if self.thread is not None:
+      self.queue.put(None)
+      self.thread.join()
+      self.thread = None
+    if self.file is not None:
+      self.file.close()
+      self.file = None
+    if self.error is not None:
+      raise self.error
+
+  def write_header(self, tensor):
+    pass
+
+  @abc.abstractmethod
+  def write_record(self, count, cells):
+    pass
+
+
+class NdjsonWriter(BackgroundWriter):
+  # First line: {"axes": [...], "shape": [...]}
+  # Then one line per solution: {"solution": n, "ones": [[i, j, ...], ...]}
+
+  def write_header(self, tensor):
+    header = {'axes': list(tensor.axes), 'shape': list(tensor.shape)}
+    self.file.write((json.dumps(header) + '\n').encode())
+
+  def write_record(self, count, cells):
+    values = np.zeros(self.shape, dtype=np.int8)
+    values[self.mask] = cells
+    record = {'solution': count, 'ones': np.argwhere(values).tolist()}
+    self.file.write((json.dumps(record) + '\n').encode())
+
+
+class BinaryWriter(BackgroundWriter):
+  # BINARY_MAGIC, uint32 header length, JSON header, the packed presence mask,
+  # then fixed-size records: int64 solution number + packed cell bits
+
+  def write_header(self, tensor):
+    num_cells = int(tensor.mask.sum())
+    header = json.dumps({
+        'axes': list(tensor.axes),
+        'shape': list(tensor.shape),
+        'num_cells': num_cells,
+        'record_bytes': 8 + (num_cells + 7) // 8,
+    }).encode()
+    self.file.write(BINARY_MAGIC)
+    self.file.write(struct.pack('<I', len(header)))
+    self.file.write(header)
+    self.file.write(np.packbits(tensor.mask.ravel()).tobytes())
+
+  def write_record(self, count, cells):
+    self.file.write(struct.pack('<q', count))
+    self.file.write(np.packbits(cells).tobytes())
+
+
+def read_binary(path):
+  """Yields (solution number, 0/1 values tensor) from a BinaryWriter file."""
+  with open(path, 'rb') as f:
+    if f.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+      raise ValueError('%s is not a binary solution file' % path)
+    header_len, = struct.unpack('<I', f.read(4))
+    header = json.loads(f.read(header_len))
+    shape = tuple(header['shape'])
+    size = int(np.prod(shape, dtype=np.int64))
+    mask = np.unpackbits(np.frombuffer(f.read((size + 7) // 8), dtype=np.uint8),
+                         count=size).astype(bool).reshape(shape)
+    num_cells = header['num_cells']
+    while True:
+      record = f.read(header['record_bytes'])
+      if len(record) < header['record_bytes']:
+        return
+      count, = struct.unpack('<q', record[:8])
+      cells = np.unpackbits(np.frombuffer(record[8:], dtype=np.uint8),
+                            count=num_cells)
+      values = np.zeros(shape, dtype=np.int8)
+      values[mask] = cells
+      yield count, values
@@ -0,0 +1,180 @@
+"""Independent components of the specialty graph, solved apart.
+
+Areas (subjects) and doctors (teachers) linked by the specialty lists form a
+bipartite graph. No constraint of marko_weeks.py or marko.py crosses two of
+its connected components: the curriculum and coverage of an area only involve
+its own doctors, and a doctor's caps only involve the areas of the doctor's
+specialties. In the marko_weeks data the RMC areas, the SFH areas, and the
+single-doctor islands SJH Dx/IR, SJH PCAC Dx/Mammo and SFH IR are such
+components.
+
+split_problem() cuts a problem into one sub-problem per component, of the
+same class, so every solver and batch.py take them as they are.
+ComponentSolver solves the sub-problems in worker processes through
+solve_batch(). Counts are multiplied, which avoids enumerating the Cartesian
+product of the component solutions. The weeks of a hospital roster don't
+interact either (see break_symmetries()), so for counting every component is
+cut further into single weeks, and weeks with the same unavailability are
+enumerated once and raised to their number. Rosters are merged back into the
+layout of the full assignment tensor.
+
+  solver = ComponentSolver(problem)
+  print(solver.count())            # product of the component counts
+  values = solver.solve(time_limit=10)
+
+Doctors without a specialty belong to no component and never work. The
+objectives are optimized per component, so balance_workdays balances
+each component on its own.
+"""
+
+import numpy as np
+
+from batch import BatchJob
+from batch import solve_batch
+from rolling_horizon import window_problem
+from solution_count import components
+
+
+class Component(object):
+  # A sub-problem and the indices of its rows (areas or subjects) and people
+  # (doctors or teachers) in the full problem
+
+  def __init__(self, problem, rows, people):
+    self.problem = problem
+    self.rows = rows
+    self.people = people
+
+  @property
+  def name(self):
+    return ', '.join(str(x) for x in self.row_names)
+
+  @property
+  def row_names(self):
+    if hasattr(self.problem, 'areas'):
+      return self.problem.areas
+    return self.problem.subjects
+
+
+def hospital_component(problem, areas, doctors):
+  index = dict((d, i) for i, d in enumerate(doctors))
+  names = [problem.areas[a] for a in areas]
+  curriculum = dict(((schedule, area), problem.curriculum[schedule, area])
+                    for schedule in problem.schedules for area in names)
+  unavailable = [(index[d], w, day) for d, w, day in problem.doctor_unavailable
+                 if d in index]
+  return type(problem)(
+      names, [problem.doctors[d] for d in doctors], curriculum,
+      [[index[d] for d in problem.specialties[a]] for a in areas],
+      problem.weeks, problem.working_days, problem.schedules, problem.versions,
+      [problem.doctor_work_days[d] for d in doctors], unavailable)
+
+
+def school_component(problem, subjects, teachers):
+  index = dict((t, i) for i, t in enumerate(teachers))
+  names = [problem.subjects[s] for s in subjects]
+  curriculum = dict(((level, subject), problem.curriculum[level, subject])
+                    for level in problem.levels for subject in names)
+  return type(problem)(
+      names, [problem.teachers[t] for t in teachers], curriculum,
+      [[index[t] for t in problem.specialties[s]] for s in subjects],
+      problem.working_days, problem.levels, problem.sections,
+      [problem.teacher_work_hours[t] for t in teachers])
+
+
+def split_problem(problem):
+  """Returns the Components of a marko_weeks or marko problem."""
+  if hasattr(problem, 'weeks'):
+    num_rows, build = len(problem.areas), hospital_component
+  elif hasattr(problem, 'periods'):
+    raise ValueError('%s couples subjects through the course timetable, it '
+                     'doesn\'t decompose' % type(problem).__name__)
+  else:
+    num_rows, build = len(problem.subjects), school_component
+  specialties = [sorted(set(problem.specialties[r])) for r in range(num_rows)]
+  return [Component(build(problem, rows, people), rows, people)
+          for rows, people in components(num_rows, specialties)]
+
+
+def merge(shape, row_axis, people_axis, parts):
+  """Full 0/1 tensor from (Component, values) pairs."""
+  values = np.zeros(shape, dtype=np.int8)
+  for component, part in parts:
+    index = [slice(None)] * len(shape)
+    index[row_axis] = np.array(component.rows)[:, np.newaxis]
+    index[people_axis] = np.array(component.people)[np.newaxis, :]
+    # The two axes are next to each other, numpy keeps them in place
+    values[tuple(index)] = part
+  return values
+
+
+class ComponentSolver(object):
+
+  def __init__(self, problem, max_jobs=None, num_search_workers=None,
+               solver_options=None):
+    self.problem = problem
+    self.components = split_problem(problem)
+    self.max_jobs = max_jobs
+    self.num_search_workers = num_search_workers
+    self.solver_options = solver_options
+    # BatchResults of the last count() or solve(), in job order
+    self.results = []
+
+  def run(self, jobs):
+    results = sorted(solve_batch(jobs, max_jobs=self.max_jobs,
+                                 num_search_workers=self.num_search_workers),
+                     key=lambda r: r.index)
+    for result in results:
+      if result.error is not None:
+        raise result.error
+    self.results = results
+    return results
+
+  def count_parts(self, component):
+    # (sub-problem, name, times it repeats) to enumerate for a component
+    problem = component.problem
+    if not hasattr(problem, 'weeks'):
+      return [(problem, component.name, 1)]
+    weeks = {}
+    for w in range(len(problem.weeks)):
+      busy = frozenset((d, day) for d, week, day in problem.doctor_unavailable
+                       if week == w)
+      weeks.setdefault(busy, []).append(w)
+    return [(window_problem(problem, ws[0], ws[0] + 1),
+             '%s (%s)' % (component.name, problem.weeks[ws[0]]), len(ws))
+            for ws in weeks.values()]
+
+  def count(self):
+    """Number of solutions of the whole problem, the product of the
+    components' counts."""
+    parts = [part for c in self.components for part in self.count_parts(c)]
+    jobs = [BatchJob(problem, name=name, mode='enumerate',
+                     solver_options=self.solver_options)
+            for problem, name, _ in parts]
+    total = 1
+    for result, (_, _, repeats) in zip(self.run(jobs), parts):
+      total *= result.count ** repeats
+    return total
+
+  def solve(self, objective=None, time_limit=None, random_seed=None):
+    """Returns the merged 0/1 roster, None when some component has none.
+
+    `time_limit` applies to each component.
+    """
+    results = self.run([BatchJob(c.problem, name=c.name, objective=objective,
+                                 time_limit=time_limit, random_seed=random_seed,
+                                 solver_options=self.solver_options)
+                        for c in self.components])
+    if any(result.values is None for result in results):
+      return None
+    if hasattr(self.problem, 'weeks'):
+      num_versions = len(self.problem.schedules) * len(self.problem.versions)
+      shape = (num_versions, len(self.problem.weeks), len(self.problem.areas),
+               len(self.problem.doctors), len(self.problem.working_days))
+      row_axis, people_axis = 2, 3
+    else:
+      num_courses = len(self.problem.levels) * len(self.problem.sections)
+      shape = (num_courses, len(self.problem.subjects), len(self.problem.teachers),
+               len(self.problem.working_days))
+      row_axis, people_axis = 1, 2
+    return merge(shape, row_axis, people_axis,
+                 [(c, r.values) for c, r in zip(self.components, results)])
@@ -0,0 +1,186 @@
+"""Phase timers and search progress for the solvers.
+
+Each solver owns a Telemetry. The model build is split in phases (variable
+creation, one phase per constraint family, objective, ...) timed with
+phase(), and solving() wraps a CpSolver run: it records the response
+statistics and, with capture_log=True, keeps the CP-SAT search log, from
+which the presolve and search times are split. During an optimization the
+callback() records every improving solution and the best bound as they come.
+
+report() returns all of it as a JSON-able dict. A `listener` gets progress
+events as dicts: every phase, then solution and bound updates at most once
+every `interval` seconds.
+
+  telemetry = Telemetry(capture_log=True, listener=print, interval=5)
+  solver = HospitalSchedulingSatSolver(problem, sparse=True, telemetry=telemetry)
+  solver.solve(mode='optimize', objective='balance_workdays')
+  json.dump(telemetry.report(), f)
+"""
+
+import collections
+import contextlib
+import json
+import re
+import threading
+import time
+
+from ortools.sat.python import cp_model
+
+
+LOG_PHASE = re.compile(r'^Starting (presolve|search) at ([0-9.]+)s')
+
+
+class Telemetry(object):
+
+  def __init__(self, capture_log=False, listener=None, interval=1.0):
+    self.capture_log = capture_log
+    self.listener = listener
+    self.interval = interval
+    # phase name -> seconds, in the order the phases first ran
+    self.phases = collections.OrderedDict()
+    self.model_size = {}
+    self.search = {}
+    # {'wall', 'objective', 'bound'} per improving solution / bound update
+    self.progress = []
+    self.log = []
+    self.__lock = threading.Lock()
+    self.__log_phases = {}
+    self.__start = None
+    self.__last_event = None
+
+  @contextlib.contextmanager
+  def phase(self, name):
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.add_phase(name, time.perf_counter() - start)
+
+  def add_phase(self, name, seconds):
+    # Phases that run more than once (e.g. two solves) add up
+    self.phases[name] = self.phases.get(name, 0.0) + seconds
+    self.emit({'event': 'phase', 'phase': name, 'seconds': seconds}, force=True)
+
+  def record_model(self, model):
+    proto = model.Proto()
+    self.model_size = {'variables': len(proto.variables),
+                       'constraints': len(proto.constraints)}
+
+  @contextlib.contextmanager
+  def solving(self, solver):
+    """Wraps a Solve() / SearchForAllSolutions() call on `solver`."""
+    solver.best_bound_callback = self.on_bound
+    if self.capture_log:
+      solver.parameters.log_search_progress = True
+      solver.parameters.log_to_stdout = False
+      solver.log_callback = self.on_log
+    self.__log_phases = {}
+    self.__start = time.perf_counter()
+    try:
+      yield
+    finally:
+      total = time.perf_counter() - self.__start
+      if 'presolve' in self.__log_phases and 'search' in self.__log_phases:
+        search_start = self.__log_phases['search']
+        self.add_phase('presolve', search_start - self.__log_phases['presolve'])
+        self.add_phase('search', max(0.0, total - search_start))
+      else:
+        self.add_phase('search', total)
+    # Only a search that returned has a response, an exception raised during
+    # it goes through unchanged
+    self.record_response(solver)
+    self.emit(dict(self.search, event='done'), force=True)
+
+  def record_response(self, solver):
+    response = solver.ResponseProto()
+    self.search = {
+        'status': solver.StatusName(response.status),
+        'branches': response.num_branches,
+        'conflicts': response.num_conflicts,
+        'wall_time': response.wall_time,
+        'user_time': response.user_time,
+        'deterministic_time': response.deterministic_time,
+    }
+    if self.progress:
+      self.search['objective'] = response.objective_value
+      self.search['bound'] = response.best_objective_bound
+
+  def callback(self):
+    # Solution callback for Solve(), records the objective progress
+    return ProgressCallback(self)
+
+  def elapsed(self):
+    return time.perf_counter() - self.__start
+
+  def on_solution(self, objective, bound):
+    point = {'wall': self.elapsed(), 'objective': objective, 'bound': bound}
+    with self.__lock:
+      self.progress.append(point)
+    self.emit(dict(point, event='solution'))
+
+  def on_bound(self, bound):
+    objective = self.progress[-1]['objective'] if self.progress else None
+    point = {'wall': self.elapsed(), 'objective': objective, 'bound': bound}
+    with self.__lock:
+      self.progress.append(point)
+    self.emit(dict(point, event='bound'))
+
+  def on_log(self, message):
+    with self.__lock:
+      for line in message.splitlines():
+        self.log.append(line)
+        match = LOG_PHASE.match(line)
+        if match:
+          self.__log_phases[match.group(1)] = float(match.group(2))
+
+  def emit(self, event, force=False):
+    # Progress events are throttled to one per interval, the others always go
+    if self.listener is None:
+      return
+    with self.__lock:
+      now = time.perf_counter()
+      if (not force and self.__last_event is not None and
+          now - self.__last_event < self.interval):
+        return
+      self.__last_event = now
+    self.listener(event)
+
+  def report(self):
+    report = {
+        'phases': dict(self.phases),
+        'model': dict(self.model_size),
+        'search': dict(self.search),
+        'progress': list(self.progress),
+    }
+    if self.capture_log:
+      report['log'] = list(self.log)
+    return report
+
+  def to_json(self, **kwargs):
+    return json.dumps(self.report(), **kwargs)
+
+  def summary(self):
+    lines = ['- Phases']
+    for name, seconds in self.phases.items():
+      lines.append('  - %-28s %8.3fs' % (name, seconds))
+    if self.model_size:
+      lines.append('- Model')
+      for key, value in self.model_size.items():
+        lines.append('  - %s %i' % (key, value))
+    if self.search:
+      lines.append('- Search')
+      for key, value in self.search.items():
+        lines.append('  - %s %s' % (key, value))
+    return '\n'.join(lines)
+
+
+class ProgressCallback(cp_model.CpSolverSolutionCallback):
+
+  def __init__(self, telemetry):
+    cp_model.CpSolverSolutionCallback.__init__(self)
+    self.__telemetry = telemetry
+
+  def on_solution_callback(self):
+    self.__telemetry.on_solution(self.ObjectiveValue(), self.BestObjectiveBound())
+
+  NewSolution = on_solution_callback
@@ -0,0 +1,115 @@
+"""NumPy-indexed container for the CP-SAT decision variables.
+
+The solvers used to keep their variables in a dict keyed by 4- and 5-tuples
+and built every constraint with sum() over nested generators. A VarTensor keeps
+the same variables in an object array with one named axis per index, plus a
+boolean mask telling which cells hold a variable (in sparse mode the ineligible
+cells stay empty). Constraint families are emitted from axis reductions, each
+one a single flat LinearExpr.Sum instead of a chain of Python additions.
+"""
+
+import numpy as np
+
+from ortools.sat.python import cp_model
+
+
+class VarTensor(object):
+
+  def __init__(self, axes, shape):
+    self.axes = tuple(axes)
+    self.shape = tuple(shape)
+    self.vars = np.empty(self.shape, dtype=object)
+    self.mask = np.zeros(self.shape, dtype=bool)
+    self.__indices = None
+
+  @property
+  def ndim(self):
+    return len(self.shape)
+
+  def __setitem__(self, key, var):
+    self.vars[key] = var
+    self.mask[key] = True
+    self.__indices = None
+
+  def __getitem__(self, key):
+    # Same indexing as the old dict: assignment[sv, w, a, d, day]
+    return self.vars[key]
+
+  def __contains__(self, key):
+    return bool(self.mask[key])
+
+  def __len__(self):
+    return int(self.mask.sum())
+
+  def items(self):
+    # Present cells in C order, the order the nested build loops used
+    for idx in np.argwhere(self.mask):
+      key = tuple(int(i) for i in idx)
+      yield key, self.vars[key]
+
+  def keys(self):
+    for key, _ in self.items():
+      yield key
+
+  def flat(self):
+    return list(self.vars[self.mask])
+
+  def select(self, **fixed):
+    # Slicing helper by axis name, e.g. select(week=0, doctor=3) returns the
+    # list of variables of doctor 3 in week 0 over every other axis
+    key = tuple(fixed.pop(ax, slice(None)) for ax in self.axes)
+    if fixed:
+      raise KeyError('unknown axes %s' % sorted(fixed))
+    return list(self.vars[key][self.mask[key]])
+
+  def axis_index(self, names):
+    return [self.axes.index(n) for n in names]
+
+  def sums(self, over):
+    """Yields (index, expr) for every cell of the axes not in `over`.
+
+    `index` is a tuple over the remaining axes, in tensor order, and `expr` is
+    the LinearExpr.Sum of the present variables reduced over `over`.
+    """
+    over = self.axis_index(over)
+    keep = [ax for ax in range(self.ndim) if ax not in over]
+    keep_shape = tuple(self.shape[ax] for ax in keep)
+    rows = int(np.prod(keep_shape, dtype=np.int64))
+    order = keep + over
+    values = np.transpose(self.vars, order).reshape(rows, -1)
+    present = np.transpose(self.mask, order).reshape(rows, -1)
+    for row, index in enumerate(np.ndindex(*keep_shape)):
+      yield index, cp_model.LinearExpr.Sum(list(values[row][present[row]]))
+
+  def proto_indices(self):
+    # Index of every present variable in the model proto, -1 for empty cells
+    if self.__indices is None:
+      indices = np.full(self.shape, -1, dtype=np.int64)
+      indices[self.mask] = [v.Index() for v in self.vars[self.mask]]
+      self.__indices = indices
+    return self.__indices
+
+  def restore(self, model, indices):
+    # Inverse of proto_indices(): fills the tensor from the indices of a model
+    # whose proto was loaded, not built (see model_cache.py)
+    proto = model.Proto()
+    self.mask = indices >= 0
+    self.vars = np.empty(self.shape, dtype=object)
+    for key in zip(*self.mask.nonzero()):
+      self.vars[key] = cp_model.IntVar(proto, int(indices[key]))
+    self.__indices = indices
+
+  def values_from(self, solution):
+    """Maps a flat solution (CpSolverResponse.solution) onto the tensor.
+
+    Returns an int8 array of the tensor's shape, 0 in the empty cells.
+    """
+    solution = np.asarray(solution)
+    indices = self.proto_indices()
+    values = np.zeros(self.shape, dtype=np.int8)
+    values[self.mask] = solution[indices[self.mask]]
+    return values
+
+  def counts(self, over):
+    # Number of present variables behind each reduction, same layout as sums()
+    return self.mask.sum(axis=tuple(self.axis_index(over)))